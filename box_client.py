@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+# Thin client for the box server (tesstrain.boxserver), used by the %.box
+# recipes of the Makefile with BOX_SERVER=1:
+#
+#   box_client.py SOCKET IDLE SCRIPT IMAGE TXT BOX
+#
+# This runs once per line, so the common case (a running server) only needs
+# the interpreter and _socket; argparse, the socket module (which imports
+# enum and selectors) and the tesstrain package are only loaded to start the
+# server or to generate the box file locally.
+
+import os
+import sys
+
+import _socket
+
+
+def main(argv):
+    if len(argv) != 6:
+        sys.exit('usage: box_client.py SOCKET IDLE SCRIPT IMAGE TXT BOX')
+    socket_path, idle, *paths = argv
+    reply = b''
+    if hasattr(_socket, 'AF_UNIX'):
+        request = '\t'.join(['box'] + [os.path.abspath(path) for path in paths])
+        sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+            sock.sendall(request.encode('utf-8') + b'\n')
+            while not reply.endswith(b'\n'):
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                reply += chunk
+        except OSError:
+            pass
+        finally:
+            sock.close()
+    if reply.startswith(b'ok\t'):
+        return 0
+    if reply.startswith(b'error\t'):
+        print(reply[6:].decode('utf-8').strip(), file=sys.stderr)
+        return 1
+
+    # No server (yet).
+    try:
+        from tesstrain import boxserver
+    except ImportError:
+        # Not installed, use the package from the source tree.
+        import pathlib
+
+        sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent / 'src'))
+        from tesstrain import boxserver
+    script, image, txt, box = paths
+    return boxserver.main(
+        ['box', '--socket', socket_path, '--idle', idle, '--script', script]
+        + ['-i', image, '-t', txt, '-o', box]
+    )
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
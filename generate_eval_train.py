@@ -1,26 +1,74 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import argparse
+import hashlib
+import os
 import pathlib
 import sys
 
 
-def split_file(input_file, ratio):
+def hash_fraction(line, seed):
+    """
+    Return a number in [0, 1) computed from the basename of line and seed,
+    which is the same in every run.
+    """
+    name = os.path.basename(line.strip())
+    digest = hashlib.sha256(f'{seed}\0{name}'.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') / 2**64
+
+
+def split_file(input_file, ratio, split='ratio', seed='0'):
     """
     Splits a text file into list.train and  list.eval with lines ratio.
+
+    With split='ratio', the first ratio of the lines go to list.train.
+    With split='hash', each line goes to list.train if the hash_fraction()
+    of its basename and seed is below ratio, so adding lines to the input
+    never moves other lines between train and eval. The input is read line
+    by line in that case. This needs one .lstmf file per line: the lines
+    of the multi-line shards of lstmf.py --shard-size change when lines are
+    added, so a list of shards (which have a .list file next to them) is
+    refused.
     """
     if not isinstance(input_file, pathlib.Path):
         input_file = pathlib.Path(input_file)
     if not input_file.exists():
         print(f"'{input_file}' not exists!")
         return False
-    lines = input_file.read_text().splitlines()
 
-    split_point = int(ratio * len(lines))
     output_dir = input_file.resolve().parent
     train_list = pathlib.Path(output_dir, 'list.train')
     eval_list = pathlib.Path(output_dir, 'list.eval')
 
+    if split == 'hash':
+        with open(input_file, 'r') as f0:
+            first = f0.readline().strip()
+        if first.endswith('.lstmf') and os.path.exists(
+            first[: -len('.lstmf')] + '.list'
+        ):
+            print(
+                f"'{input_file}' lists .lstmf shards, which cannot be split "
+                "by hash, use the ratio split!"
+            )
+            return False
+        with open(input_file, 'r') as f0, open(
+            train_list, 'w', newline='\n'
+        ) as f1, open(eval_list, 'w', newline='\n') as f2:
+            separators = {f1: '', f2: ''}
+            for line in f0:
+                line = line.rstrip('\n')
+                if not line:
+                    continue
+                f = f1 if hash_fraction(line, seed) < ratio else f2
+                f.write(separators[f] + line)
+                separators[f] = '\n'
+        return True
+
+    lines = input_file.read_text().splitlines()
+
+    split_point = int(ratio * len(lines))
+
     with open(train_list, 'w', newline='\n') as f1, open(
         eval_list, 'w', newline='\n'
     ) as f2:
@@ -29,11 +77,31 @@ def split_file(input_file, ratio):
     return True
 
 
-ratio = 0.95
-input_file = None
-if len(sys.argv) > 1:
-    input_file = sys.argv[1]
-if len(sys.argv) > 2:
-    ratio = float(sys.argv[2])
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(
+        description='Splits a list of .lstmf files into list.train and list.eval'
+    )
+    arg_parser.add_argument('input_file', help='List of .lstmf files')
+    arg_parser.add_argument(
+        'ratio',
+        nargs='?',
+        type=float,
+        default=0.95,
+        help='Ratio of the lines for training (default: %(default)s)',
+    )
+    arg_parser.add_argument(
+        '--split',
+        choices=['ratio', 'hash'],
+        default='ratio',
+        help='ratio: cut the (shuffled) list at the ratio; hash: assign each '
+        'line by a hash of its basename and --seed, which keeps the eval set '
+        'stable when lines are added, but only for one .lstmf file per line, '
+        'not for the shards of lstmf.py --shard-size (default: %(default)s)',
+    )
+    arg_parser.add_argument(
+        '--seed', default='0', help='Seed of the hash split (default: 0)'
+    )
+    args = arg_parser.parse_args()
 
-split_file(input_file, ratio)
+    if not split_file(args.input_file, args.ratio, args.split, args.seed):
+        sys.exit(1)
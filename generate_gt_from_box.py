@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 
 import argparse
+import concurrent.futures
 import io
+import os
+import sys
+
+GT_SUFFIX = '.gt.txt'
 
 #
 # command line arguments
@@ -17,36 +22,146 @@ arg_parser.add_argument(
     nargs='?',
     metavar='TXT',
     help='Line text (GT)',
-    required=True,
 )
 
 # Text box file
 arg_parser.add_argument(
     '-b',
     '--box',
-    nargs='?',
+    nargs='+',
     metavar='BOX',
-    help='text2image generated box file (BOX)',
+    help='text2image generated box file(s) (BOX)',
     required=True,
 )
 
-args = arg_parser.parse_args()
+arg_parser.add_argument(
+    '-o',
+    '--output-dir',
+    metavar='DIR',
+    help='Write one .gt.txt file per text line into DIR instead of a single TXT',
+)
+
+arg_parser.add_argument(
+    '--name-format',
+    default='{stem}_{line:06d}',
+    help='Name of the per line files without .gt.txt, with the fields stem '
+    '(box file name without .box), page and line (index of the text line in '
+    'the box file, from 0) (default: %(default)s)',
+)
+
+arg_parser.add_argument(
+    '-j',
+    '--jobs',
+    type=int,
+    default=0,
+    help='Number of box files processed in parallel (default: number of CPUs)',
+)
+
+CHUNK_SIZE = 1 << 20
+
+
+def box_char(line):
+    """
+    Return the character of a box file line. Spaces are kept and the end of a
+    text line is returned as '\\n'.
+    """
+    # uses US (ASCII unit separator, U+001F) for substitution to get the space
+    # delimiters
+    char = line.replace('  ', '\u001f ').split(' ', 1)[0]
+    return char.replace('\u001f', ' ').replace('\t', '\n')
+
+
+def write_gt(box, txt):
+    """
+    Write the whole text of box to txt. The box file is read in chunks of
+    about CHUNK_SIZE bytes, so memory use does not depend on its size.
+    """
+    with io.open(box, 'r', encoding='utf-8') as boxfile, io.open(
+        txt, 'w', encoding='utf-8'
+    ) as gtfile:
+        while True:
+            lines = boxfile.readlines(CHUNK_SIZE)
+            if not lines:
+                break
+            gtfile.write(
+                ''.join(
+                    line.replace('  ', '\u001f ').split(' ', 1)[0]
+                    for line in lines
+                )
+                .replace('\u001f', ' ')
+                .replace('\t', '\n')
+            )
+        gtfile.write('\n\n')
+
+
+def box_lines(boxfile):
+    """Generate (page, text) for each text line of a box file."""
+    chars = []
+    for line in boxfile:
+        char = box_char(line)
+        if char == '\n':
+            fields = line.rsplit(' ', 1)
+            page = int(fields[1]) if len(fields) == 2 else 0
+            yield page, ''.join(chars)
+            chars = []
+        elif char:
+            chars.append(char)
+    if chars:
+        yield -1, ''.join(chars)
+
+
+def split_gt(box, output_dir, name_format):
+    """
+    Write one .gt.txt file per text line of box into output_dir and return
+    the number of written files. Only one text line is held in memory.
+    """
+    stem = os.path.basename(box)
+    if stem.endswith('.box'):
+        stem = stem[: -len('.box')]
+    count = 0
+    with io.open(box, 'r', encoding='utf-8') as boxfile:
+        for index, (page, text) in enumerate(box_lines(boxfile)):
+            text = text.strip()
+            if not text:
+                continue
+            name = name_format.format(stem=stem, page=page, line=index)
+            with io.open(
+                os.path.join(output_dir, name + GT_SUFFIX), 'w', encoding='utf-8'
+            ) as gtfile:
+                gtfile.write(text + '\n')
+            count += 1
+    return count
+
 
 #
 # main
-# uses US (ASCII unit separator, U+001F) for substitution to  get the space delimiters
 #
 
-gtstring = io.StringIO()
-gtfile = open(args.txt, 'w', encoding='utf-8')
-with io.open(args.box, 'r', encoding='utf-8') as boxfile:
-    print(
-        ''.join(
-            line.replace('  ', '\u001f ').split(' ', 1)[0]
-            for line in boxfile
-            if line
-        ),
-        file=gtstring,
-    )
-gt = gtstring.getvalue().replace('\u001f', ' ').replace('\t', '\n')
-print(gt, file=gtfile)
+
+def main():
+    args = arg_parser.parse_args()
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        jobs = min(args.jobs or os.cpu_count() or 1, len(args.box))
+        errors = 0
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(split_gt, box, args.output_dir, args.name_format): box
+                for box in args.box
+            }
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    count = future.result()
+                except Exception as e:
+                    print('ERROR: %s: %s' % (futures[future], e), file=sys.stderr)
+                    errors += 1
+                else:
+                    print('%s: %d lines' % (futures[future], count))
+        sys.exit(1 if errors else 0)
+    if not args.txt or len(args.box) != 1:
+        arg_parser.error('--txt requires exactly one --box (or use --output-dir)')
+    write_gt(args.box[0], args.txt)
+
+
+if __name__ == '__main__':
+    main()
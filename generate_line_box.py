@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 
 import argparse
-import io
-import unicodedata
+import functools
+import pathlib
+import sys
 
-from PIL import Image
+try:
+    from tesstrain import boxes, groundtruth
+except ImportError:
+    # Not installed, use the package from the source tree.
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent / 'src'))
+    from tesstrain import boxes, groundtruth
 
 #
 # command line arguments
@@ -20,7 +26,6 @@ arg_parser.add_argument(
     nargs='?',
     metavar='TXT',
     help='Line text (GT)',
-    required=True,
 )
 
 # Image file
@@ -30,36 +35,15 @@ arg_parser.add_argument(
     nargs='?',
     metavar='IMAGE',
     help='Image file',
-    required=True,
 )
 
-args = arg_parser.parse_args()
+groundtruth.add_batch_arguments(arg_parser)
+
+make_box = functools.partial(boxes.make_box, box_function=boxes.char_boxes)
 
 #
 # main
 #
 
-# Get image size.
-width, height = Image.open(args.image).size
-
-# load gt
-with io.open(args.txt, 'r', encoding='utf-8') as f:
-    lines = f.read().strip().split('\n')
-    if len(lines) != 1:
-        raise ValueError(
-            'ERROR: %s: Ground truth text file should contain exactly one line, not %s'
-            % (args.txt, len(lines))
-        )
-    line = unicodedata.normalize('NFC', lines[0].strip())
-
-if line:
-    for i in range(1, len(line)):
-        char = line[i]
-        prev_char = line[i - 1]
-        if unicodedata.combining(char):
-            print('%s 0 0 %d %d 0' % ((prev_char + char), width, height))
-        elif not unicodedata.combining(prev_char):
-            print('%s 0 0 %d %d 0' % (prev_char, width, height))
-    if not unicodedata.combining(line[-1]):
-        print('%s 0 0 %d %d 0' % (line[-1], width, height))
-    print('\t 0 0 %d %d 0' % (width, height))
+if __name__ == '__main__':
+    groundtruth.run_box_cli(arg_parser, make_box)
@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 
 import argparse
-import io
-import unicodedata
+import functools
+import pathlib
+import sys
 
-from PIL import Image
+try:
+    from tesstrain import boxes, groundtruth
+except ImportError:
+    # Not installed, use the package from the source tree.
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent / 'src'))
+    from tesstrain import boxes, groundtruth
 
 #
 # command line arguments
@@ -20,7 +26,6 @@ arg_parser.add_argument(
     nargs='?',
     metavar='TXT',
     help='Line text (GT)',
-    required=True,
 )
 
 # Image file
@@ -30,61 +35,15 @@ arg_parser.add_argument(
     nargs='?',
     metavar='IMAGE',
     help='Image file',
-    required=True,
 )
 
-args = arg_parser.parse_args()
+groundtruth.add_batch_arguments(arg_parser)
+
+make_box = functools.partial(boxes.make_box, box_function=boxes.syllable_boxes)
 
 #
 # main
 #
 
-# https://stackoverflow.com/questions/6805311/combining-devanagari-characters
-# Letters are category Lo (Letter, Other), vowel signs are category Mc (Mark, Spacing Combining),
-# virama is category Mn (Mark, Nonspacing) and spaces are category Zs (Separator, Space).
-
-
-def splitclusters(s):
-    """Generate the grapheme clusters for the string s. (Not the full
-    Unicode text segmentation algorithm, but probably good enough for
-    Devanagari.)
-
-    """
-    # http://pyright.blogspot.com/2009/12/pythons-unicodedata-module.html
-    # The combining code is typically zero.  The virama gets its own special code of nine.
-    # i.e. unicodedata.category=Mn unicodedata.combining=9
-    # (Could be used to extend for other Indic languages).
-
-    virama = '\N{DEVANAGARI SIGN VIRAMA}'
-    cluster = ''
-    last = None
-    for c in s:
-        cat = unicodedata.category(c)[0]
-        if cat == 'M' or cat == 'L' and last == virama:
-            cluster += c
-        else:
-            if cluster:
-                yield cluster
-            cluster = c
-        last = c
-    if cluster:
-        yield cluster
-
-
-# Get image size.
-width, height = Image.open(args.image).size
-
-# load gt
-with io.open(args.txt, 'r', encoding='utf-8') as f:
-    lines = f.read().strip().split('\n')
-    if len(lines) != 1:
-        raise ValueError(
-            'ERROR: %s: Ground truth text file should contain exactly one line, not %s'
-            % (args.txt, len(lines))
-        )
-    line = unicodedata.normalize('NFC', lines[0].strip())
-
-if line:
-    for syllable in splitclusters(line):
-        print('%s 0 0 %d %d 0' % (syllable, width, height))
-        print('\t 0 0 %d %d 0' % (width, height))
+if __name__ == '__main__':
+    groundtruth.run_box_cli(arg_parser, make_box)
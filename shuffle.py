@@ -3,41 +3,52 @@
 # shuffle.py - shuffle lines in pseudo random order
 #
 # Usage:
-#       shuffle.py [SEED [FILE]]
+#       shuffle.py [--memory SIZE] [SEED [FILE]]
 #
 # Sort and shuffle the lines read from stdin in pseudo random order
 # and write them to stdout.
 #
 # If FILE is given, then apply to that in-place (instead of stdin and stdout).
+# FILE is replaced atomically, so an interrupted run leaves it unchanged.
 #
 # The optional SEED argument is used as a seed for the random generator.
 # A shuffled list can be reproduced by using the same seed again.
+#
+# With --memory SIZE (like 500M or 2G), lists larger than the memory are
+# shuffled with temporary files, keeping about SIZE of lines in memory. The
+# order is another one than without --memory, but it does not depend on SIZE.
 
-import random
+import argparse
+import pathlib
 import sys
 
-# If at least one argument was given, the first argument is used as the seed.
-if len(sys.argv) > 1:
-    random.seed(sys.argv[1])
-
-if len(sys.argv) > 2:
-    fd0 = open(sys.argv[2], 'r')
-else:
-    fd0 = sys.stdin
-
-# Read lines from standard input.
-lines = fd0.readlines()
-
-# First sort the input lines (directory entries may come in undefined order).
-lines.sort()
-
-# Then shuffle the lines.
-random.shuffle(lines)
-
-if len(sys.argv) > 2:
-    fd1 = open(sys.argv[2], 'w')
+try:
+    from tesstrain import shuffle
+    from tesstrain.sizes import parse_size
+except ImportError:
+    # Not installed, use the package from the source tree.
+    sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent / 'src'))
+    from tesstrain import shuffle
+    from tesstrain.sizes import parse_size
+
+arg_parser = argparse.ArgumentParser(
+    description='Shuffle lines in pseudo random order'
+)
+arg_parser.add_argument('seed', nargs='?', help='Seed for the random generator')
+arg_parser.add_argument('file', nargs='?', help='File to shuffle in-place')
+arg_parser.add_argument(
+    '--memory',
+    type=parse_size,
+    metavar='SIZE',
+    help='Shuffle with temporary files, keeping about SIZE of lines in memory',
+)
+args = arg_parser.parse_args()
+
+if args.file:
+    shuffle.shuffle_file(args.file, args.seed, memory=args.memory)
+elif args.memory:
+    shuffle.external_shuffle(sys.stdin.buffer, sys.stdout.buffer, args.seed, args.memory)
 else:
-    fd1 = sys.stdout
-
-# Write the shuffled lines to standard output.
-fd1.writelines(lines)
+    # Read lines from standard input and write the shuffled lines to
+    # standard output.
+    sys.stdout.writelines(shuffle.shuffle_lines(sys.stdin.readlines(), args.seed))
@@ -10,6 +10,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from tesstrain.wrapper import run
-
 __version__ = '0.1'
+
+
+def __getattr__(name):
+    # Import the training wrapper lazily, so that lightweight modules like
+    # tesstrain.groundtruth can be used by the scripts without pulling in
+    # the dependencies of the whole training pipeline.
+    if name == 'run':
+        from tesstrain.wrapper import run
+
+        return run
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
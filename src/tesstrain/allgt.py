@@ -0,0 +1,239 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Single pass builder for the `all-gt` file with character statistics.
+
+`build` concatenates the `.gt.txt` files into `all-gt` exactly like the
+former `$(file ...)` loop of the Makefile (the content of each file, ending
+with a newline), using large buffered writes. In
+the same pass it counts the extended grapheme clusters and the code points
+of the text and writes them to a JSON sidecar file:
+
+    {"lines": 1234,
+     "graphemes": [["e", 4711], ...],
+     "codepoints": [["U+0065", "e", 4711], ...]}
+
+Both histograms are sorted by decreasing count. `charfreq` in the Makefile
+prints the graphemes from this file with `show` instead of segmenting
+`all-gt` with grep and sorting every cluster, and other tools can load it
+with read_charfreq(). `stats` computes the sidecar file for an existing text
+file.
+"""
+
+import argparse
+import collections
+import json
+import sys
+
+from tesstrain import graphemes, groundtruth
+
+BUFFER_SIZE = 1 << 20
+
+# Number of lines counted at once.
+STATS_LINES = 10000
+
+
+class CharStats:
+    """Grapheme cluster and code point histograms of text lines."""
+
+    def __init__(self):
+        self.lines = 0
+        self.graphemes = collections.Counter()
+        self.segmenter = graphemes.Segmenter()
+
+    @property
+    def codepoints(self):
+        """Counter of the code points (computed from the grapheme clusters)."""
+        codepoints = collections.Counter()
+        for cluster, count in self.graphemes.items():
+            for c in cluster:
+                codepoints[c] += count
+        return codepoints
+
+    def add_lines(self, lines):
+        """Count the characters of lines (strings without line breaks)."""
+        lines = list(lines)
+        self.lines += len(lines)
+        text = '\n'.join(lines)
+        # A space is a cluster of its own unless a mark follows it, so the
+        # clusters of each distinct word are counted once with the number
+        # of its occurrences. Only lines with words whose clusters include
+        # adjacent spaces are segmented as a whole.
+        words = collections.Counter(text.replace('\n', ' ').split(' '))
+        spaces = text.count(' ')
+        clusters = {}
+        context_words = set()
+        for word in words:
+            if word:
+                word_clusters = self.segmenter.split_word(word)
+                if word_clusters is None:
+                    context_words.add(word)
+                else:
+                    clusters[word] = word_clusters
+        if context_words:
+            for line in lines:
+                line_words = line.split(' ')
+                if context_words.isdisjoint(line_words):
+                    continue
+                words.subtract(line_words)
+                spaces -= len(line_words) - 1
+                self.graphemes.update(self.segmenter.split(line))
+        graphemes = self.graphemes
+        for word, word_clusters in clusters.items():
+            count = words[word]
+            for cluster in word_clusters:
+                graphemes[cluster] += count
+        if spaces:
+            graphemes[' '] += spaces
+
+    def to_json(self):
+        def by_count(item):
+            return -item[1], item[0]
+
+        return {
+            'lines': self.lines,
+            'graphemes': [
+                [cluster, count]
+                for cluster, count in sorted(self.graphemes.items(), key=by_count)
+            ],
+            'codepoints': [
+                ['U+%04X' % ord(c), c, count]
+                for c, count in sorted(self.codepoints.items(), key=by_count)
+            ],
+        }
+
+    def write(self, path):
+        groundtruth.write_atomic(
+            path, json.dumps(self.to_json(), ensure_ascii=False) + '\n'
+        )
+
+
+def read_charfreq(path):
+    """Return the histograms written by CharStats.write() as a dict."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def build(gt_files, output, stats=None):
+    """
+    Concatenate gt_files into output (replaced atomically) and add their text
+    to stats (a CharStats) if given.
+    """
+    lines = []
+    with groundtruth.open_atomic(output, 'wb', buffering=BUFFER_SIZE) as out:
+        for txt in gt_files:
+            with open(txt, 'rb') as f:
+                data = f.read()
+            # $(file <...) drops a final newline, $(file >>...) adds one
+            # unless the text ends with a newline.
+            if data.endswith(b'\n'):
+                data = data[:-1]
+            if not data.endswith(b'\n'):
+                data += b'\n'
+            out.write(data)
+            if stats is not None:
+                lines.extend(data[:-1].decode('utf-8', errors='replace').split('\n'))
+                if len(lines) >= STATS_LINES:
+                    stats.add_lines(lines)
+                    lines = []
+        if stats is not None:
+            stats.add_lines(lines)
+
+
+def text_stats(path):
+    """Return the CharStats of an existing text file (like `all-gt`)."""
+    stats = CharStats()
+    with open(path, 'r', encoding='utf-8', errors='replace', newline='\n') as f:
+        while True:
+            lines = f.readlines(BUFFER_SIZE)
+            if not lines:
+                break
+            stats.add_lines(line.rstrip('\n') for line in lines)
+    return stats
+
+
+def show(charfreq, codepoints=False, file=None):
+    """Print a histogram like `uniq -c | sort -rn`."""
+    file = file or sys.stdout
+    if codepoints:
+        for codepoint, c, count in charfreq['codepoints']:
+            print('%7d %s %s' % (count, codepoint, c), file=file)
+    else:
+        for cluster, count in charfreq['graphemes']:
+            print('%7d %s' % (count, cluster), file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tesstrain.allgt',
+        description='Build all-gt and its grapheme and code point histograms.',
+    )
+    parser.add_argument(
+        'command',
+        choices=['build', 'stats', 'show'],
+        help='build: concatenate the *.gt.txt files into --output; '
+        'stats: count the characters of an existing --input file; '
+        'show: print the histogram of --charfreq',
+    )
+    parser.add_argument(
+        '--gt-dir', metavar='DIR', help='Use all *.gt.txt files below DIR'
+    )
+    parser.add_argument(
+        '--list',
+        metavar='FILE',
+        help="Use the *.gt.txt files listed in FILE ('-' for stdin)",
+    )
+    parser.add_argument('--output', help='Path of the all-gt file to write (build)')
+    parser.add_argument('--input', help='Text file to count (stats)')
+    parser.add_argument(
+        '--charfreq',
+        metavar='FILE',
+        help='JSON file with the histograms (written by build and stats)',
+    )
+    parser.add_argument(
+        '--codepoints',
+        action='store_true',
+        help='Show code points instead of grapheme clusters (show)',
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == 'show':
+        if not args.charfreq:
+            parser.error('show requires --charfreq')
+        show(read_charfreq(args.charfreq), codepoints=args.codepoints)
+        return 0
+    if args.command == 'stats':
+        if not (args.input and args.charfreq):
+            parser.error('stats requires --input and --charfreq')
+        text_stats(args.input).write(args.charfreq)
+        return 0
+
+    if not args.output:
+        parser.error('build requires --output')
+    if not (args.gt_dir or args.list):
+        parser.error('--gt-dir or --list is required')
+    gt_files = []
+    if args.gt_dir:
+        gt_files.extend(groundtruth.find_gt_files(args.gt_dir))
+    if args.list:
+        gt_files.extend(groundtruth.read_gt_list(args.list))
+    if not gt_files:
+        print('ERROR: found no *.gt.txt files', file=sys.stderr)
+        return 1
+    stats = CharStats() if args.charfreq else None
+    build(gt_files, args.output, stats)
+    if stats is not None:
+        stats.write(args.charfreq)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
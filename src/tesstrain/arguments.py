@@ -50,6 +50,12 @@ class TrainingArguments(argparse.Namespace):
         self.run_shape_clustering = False
         self.extract_font_properties = True
         self.distort_image = False
+        self.extract_backend = 'subprocess'
+        self.extract_jobs = 0
+        self.extract_memory_mb = 500
+        self.par_factor = 8
+        self.pipeline = False
+        self.command_timeout = 0
 
     def __eq__(self, other):
         return (
@@ -66,6 +72,12 @@ class TrainingArguments(argparse.Namespace):
             and self.run_shape_clustering == other.run_shape_clustering
             and self.extract_font_properties == other.extract_font_properties
             and self.distort_image == other.distort_image
+            and self.extract_backend == other.extract_backend
+            and self.extract_jobs == other.extract_jobs
+            and self.extract_memory_mb == other.extract_memory_mb
+            and self.par_factor == other.par_factor
+            and self.pipeline == other.pipeline
+            and self.command_timeout == other.command_timeout
         )
 
 
@@ -168,6 +180,59 @@ def get_argument_parser():
         help='Path to tesseract/tessdata directory.',
     )
 
+    parser.add_argument(
+        '--extract_backend',
+        choices=['subprocess', 'api'],
+        help=(
+            'Run tesseract for each image (subprocess) or use libtesseract '
+            'in-process (api, experimental, falls back to subprocess if the '
+            'library is not available) for feature extraction.'
+        ),
+    )
+
+    parser.add_argument(
+        '--extract_jobs',
+        metavar='N',
+        type=int,
+        help=(
+            'Number of parallel tesseract processes for feature extraction '
+            '(default: one per available CPU, limited by --extract_memory_mb).'
+        ),
+    )
+    parser.add_argument(
+        '--extract_memory_mb',
+        metavar='MB',
+        type=int,
+        help=(
+            'Memory to reserve for each tesseract process when choosing the '
+            'number of feature extraction workers (default: 500).'
+        ),
+    )
+
+    parser.add_argument(
+        '--par_factor',
+        metavar='N',
+        type=int,
+        help='Number of fonts and exposures rendered in parallel (default: 8).',
+    )
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help=(
+            'Extract the features of each image as soon as it is rendered '
+            'instead of after rendering all fonts and exposures.'
+        ),
+    )
+    parser.add_argument(
+        '--command_timeout',
+        metavar='SECONDS',
+        type=float,
+        help=(
+            'Abort if a text2image or tesseract process for one font, exposure '
+            'or image runs longer (default: no limit).'
+        ),
+    )
+
     parser.add_argument(
         '--exposures',
         metavar='EXPOSURES',
@@ -0,0 +1,283 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Micro-benchmarks of the box generation code on synthetic lines.
+
+Each benchmark compares the current implementation with the code it
+replaced (kept here as a reference) on corpora generated from a seed, and
+reports the throughput of both and the number of lines with a different
+result:
+
+* graphemes: tesstrain.graphemes (syllable boxes) against the former
+  splitclusters() of generate_line_syllable_box.py, on Hindi and Bengali
+  lines with a small vocabulary, Zipf distributed words and unique words.
+  The Bengali lines differ, since splitclusters() only knew the
+  Devanagari virama.
+* bidi: tesstrain.boxes.display_line (wordstr boxes) against calling
+  bidi.algorithm.get_display() for every line, on Hindi lines and on
+  Hebrew lines which are all unique or repeat 2000 distinct lines.
+* charboxes: tesstrain.boxes.char_boxes against the former box function of
+  generate_line_box.py, on 60 character Latin lines without and with
+  combining marks.
+"""
+
+import argparse
+import itertools
+import random
+import sys
+import time
+import unicodedata
+
+from tesstrain import boxes, graphemes
+
+
+def _letters(first, last, categories):
+    return [
+        chr(cp)
+        for cp in range(first, last + 1)
+        if unicodedata.category(chr(cp)) in categories
+    ]
+
+
+# Consonants, vowel signs and virama of Devanagari and Bengali.
+INDIC_SCRIPTS = (
+    (
+        _letters(0x0915, 0x0939, ('Lo',)),
+        _letters(0x093E, 0x094C, ('Mc', 'Mn')),
+        '\u094d',
+    ),
+    (
+        _letters(0x0995, 0x09B9, ('Lo',)),
+        _letters(0x09BE, 0x09CC, ('Mc', 'Mn')),
+        '\u09cd',
+    ),
+)
+
+LATIN_LETTERS = _letters(0x0041, 0x007A, ('Lu', 'Ll'))
+COMBINING_MARKS = _letters(0x0300, 0x036F, ('Mn',))
+HEBREW_LETTERS = _letters(0x05D0, 0x05EA, ('Lo',))
+
+WORDS_PER_LINE = 10
+
+
+def _indic_word(rng, script):
+    consonants, signs, virama = script
+    word = []
+    for _ in range(rng.randint(1, 4)):
+        word.append(rng.choice(consonants))
+        if rng.random() < 0.2:
+            word.append(virama + rng.choice(consonants))
+        if rng.random() < 0.6:
+            word.append(rng.choice(signs))
+    return ''.join(word)
+
+
+def _hebrew_word(rng):
+    return ''.join(rng.choices(HEBREW_LETTERS, k=rng.randint(2, 7)))
+
+
+def _corpus(rng, lines, make_word, vocabulary=None, zipf=False):
+    """
+    Return lines of WORDS_PER_LINE words from make_word(rng): all unique
+    without vocabulary, else drawn from vocabulary words, uniformly or with
+    Zipf distributed frequencies.
+    """
+    if vocabulary is None:
+        return [
+            ' '.join(make_word(rng) for _ in range(WORDS_PER_LINE))
+            for _ in range(lines)
+        ]
+    words = [make_word(rng) for _ in range(vocabulary)]
+    cum_weights = (
+        list(itertools.accumulate(1 / rank for rank in range(1, vocabulary + 1)))
+        if zipf
+        else None
+    )
+    return [
+        ' '.join(rng.choices(words, cum_weights=cum_weights, k=WORDS_PER_LINE))
+        for _ in range(lines)
+    ]
+
+
+def _run(func, lines):
+    start = time.perf_counter()
+    results = func(lines)
+    return time.perf_counter() - start, results
+
+
+def _differences(results, expected):
+    return sum(result != reference for result, reference in zip(results, expected))
+
+
+def _splitclusters(s):
+    """The former grapheme clusters of generate_line_syllable_box.py."""
+    virama = '\N{DEVANAGARI SIGN VIRAMA}'
+    cluster = ''
+    last = None
+    for c in s:
+        cat = unicodedata.category(c)[0]
+        if cat == 'M' or cat == 'L' and last == virama:
+            cluster += c
+        else:
+            if cluster:
+                yield cluster
+            cluster = c
+        last = c
+    if cluster:
+        yield cluster
+
+
+def _char_boxes(line, width, height):
+    """The former box function of generate_line_box.py."""
+    boxes = []
+    if line:
+        for i in range(1, len(line)):
+            char = line[i]
+            prev_char = line[i - 1]
+            if unicodedata.combining(char):
+                boxes.append('%s 0 0 %d %d 0\n' % ((prev_char + char), width, height))
+            elif not unicodedata.combining(prev_char):
+                boxes.append('%s 0 0 %d %d 0\n' % (prev_char, width, height))
+        if not unicodedata.combining(line[-1]):
+            boxes.append('%s 0 0 %d %d 0\n' % (line[-1], width, height))
+        boxes.append('\t 0 0 %d %d 0\n' % (width, height))
+    return ''.join(boxes)
+
+
+def _latin_line(rng, marks):
+    chars = []
+    while len(chars) < 60:
+        if chars and rng.random() < 0.15:
+            chars.append(' ')
+        chars.append(rng.choice(LATIN_LETTERS))
+        if rng.random() < marks:
+            chars.append(rng.choice(COMBINING_MARKS))
+    return ''.join(chars[:60])
+
+
+def benchmark_charboxes(rng, lines):
+    print(f'Character boxes of {lines} lines:')
+    for marks in (0, 0.2):
+        corpus = [_latin_line(rng, marks) for _ in range(lines)]
+        reference, expected = _run(
+            lambda lines: [_char_boxes(line, 1000, 50) for line in lines], corpus
+        )
+        current, results = _run(
+            lambda lines: [boxes.char_boxes(line, 1000, 50) for line in lines],
+            corpus,
+        )
+        print(
+            f'  {marks:.0%} letters with a mark: '
+            f'{reference:.2f} s -> {current:.2f} s '
+            f'({_differences(results, expected)} lines differ)'
+        )
+
+
+def benchmark_graphemes(rng, lines):
+    print(f'Grapheme clusters of {lines} Hindi and Bengali lines:')
+    for name, vocabulary, zipf in (
+        ('small vocabulary', 1000, False),
+        ('50k Zipf words', 50000, True),
+        ('unique words', None, False),
+    ):
+        corpora = [
+            _corpus(
+                rng,
+                lines // len(INDIC_SCRIPTS),
+                lambda rng: _indic_word(rng, script),
+                vocabulary,
+                zipf,
+            )
+            for script in INDIC_SCRIPTS
+        ]
+        corpus = [line for lines in corpora for line in lines]
+        chars = sum(map(len, corpus)) / 1e6
+        reference, expected = _run(
+            lambda lines: [list(_splitclusters(line)) for line in lines], corpus
+        )
+        # A new segmenter, so that its table and cache are filled in the run.
+        current, results = _run(graphemes.Segmenter().segment, corpus)
+        hindi = len(corpora[0])
+        print(
+            f'  {name}: splitclusters {chars / reference:.1f} Mchar/s, '
+            f'Segmenter {chars / current:.1f} Mchar/s '
+            f'({_differences(results[:hindi], expected[:hindi])} Hindi and '
+            f'{_differences(results[hindi:], expected[hindi:])} Bengali lines '
+            'differ)'
+        )
+
+
+def benchmark_bidi(rng, lines):
+    import bidi.algorithm
+
+    print(f'Display order of {lines} lines:')
+    for name, make_word, distinct in (
+        ('Hindi', lambda rng: _indic_word(rng, INDIC_SCRIPTS[0]), lines),
+        ('Hebrew, unique lines', _hebrew_word, lines),
+        ('Hebrew, 2000 distinct lines', _hebrew_word, 2000),
+    ):
+        corpus = _corpus(rng, distinct, make_word)
+        if distinct < lines:
+            corpus = rng.choices(corpus, k=lines)
+        reference, expected = _run(
+            lambda lines: list(map(bidi.algorithm.get_display, lines)), corpus
+        )
+        # Start with empty caches, as a new worker process would.
+        boxes._needs_reordering.cache_clear()
+        boxes._reorder.cache_clear()
+        current, results = _run(
+            lambda lines: list(map(boxes.display_line, lines)), corpus
+        )
+        print(
+            f'  {name}: get_display {reference / lines * 1e6:.1f} us/line, '
+            f'display_line {current / lines * 1e6:.1f} us/line '
+            f'({_differences(results, expected)} lines differ)'
+        )
+
+
+BENCHMARKS = {
+    'bidi': (benchmark_bidi, 20000),
+    'charboxes': (benchmark_charboxes, 16667),
+    'graphemes': (benchmark_graphemes, 100000),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tesstrain.benchmark',
+        description='Micro-benchmarks of the box generation code against the '
+        'code it replaced, on synthetic lines.',
+    )
+    parser.add_argument(
+        'benchmarks',
+        nargs='*',
+        metavar='BENCHMARK',
+        help='Benchmarks to run: %s (default: all)' % ', '.join(sorted(BENCHMARKS)),
+    )
+    parser.add_argument(
+        '--lines', type=int, help='Number of lines of each corpus'
+    )
+    parser.add_argument(
+        '--seed', default='0', help='Seed of the corpora (default: %(default)s)'
+    )
+    args = parser.parse_args(argv)
+    unknown = set(args.benchmarks).difference(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmark: %s' % ', '.join(sorted(unknown)))
+
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        func, lines = BENCHMARKS[name]
+        func(random.Random(args.seed), args.lines or lines)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Box file generation for line ground truth.
+
+The box functions take the text of a line and the size of its image and
+return the content of the `.box` file, so they can be used in-process (for
+example in a worker pool) without running the generate_*_box.py scripts:
+
+* char_boxes: one box per character (generate_line_box.py)
+* wordstr_boxes: one WordStr box for the whole line (generate_wordstr_box.py)
+* syllable_boxes: one box per grapheme cluster (generate_line_syllable_box.py)
+
+python-bidi is only imported when a line actually needs reordering.
+"""
+
+import functools
+import importlib.util
+import os
+import unicodedata
+
+from tesstrain import graphemes, groundtruth, imagesize
+
+# Bidirectional types for which get_display() can change a line: right to left
+# characters and Arabic numbers, explicit embeddings, overrides and isolates,
+# and boundary neutrals (like ZWJ), which it removes. Lines without them are
+# displayed as they are.
+REORDER_TYPES = frozenset(
+    ('R', 'AL', 'AN', 'BN')
+    + ('LRE', 'LRO', 'RLE', 'RLO', 'PDF', 'LRI', 'RLI', 'FSI', 'PDI')
+)
+
+
+@functools.lru_cache(maxsize=65536)
+def _needs_reordering(c):
+    return unicodedata.bidirectional(c) in REORDER_TYPES
+
+
+@functools.lru_cache(maxsize=16384)
+def _reorder(line):
+    import bidi.algorithm
+
+    return bidi.algorithm.get_display(line)
+
+
+def display_line(line):
+    """Return line in display (visual) order."""
+    if line.isascii() and line.isprintable():
+        return line
+    if not any(map(_needs_reordering, set(line))):
+        return line
+    return _reorder(line)
+
+
+class _CombiningTable(dict):
+    """Lazily filled table telling whether a character is a combining mark."""
+
+    def __missing__(self, c):
+        combining = self[c] = unicodedata.combining(c) != 0
+        return combining
+
+
+COMBINING = _CombiningTable()
+
+# make_box functions of the loaded box scripts by path: (mtime, make_box)
+_make_box_functions = {}
+
+
+def char_boxes(line, width, height):
+    """
+    Return the box file content with one box per character of line, combining
+    characters are joined with the preceding character.
+    """
+    if not line:
+        return ''
+    # All boxes span the whole line image.
+    suffix = ' 0 0 %d %d 0\n' % (width, height)
+    combining = list(map(COMBINING.__getitem__, line))
+    if not any(combining):
+        chars = line
+    else:
+        chars = []
+        for prev_char, char, prev_combining, char_combining in zip(
+            line, line[1:], combining, combining[1:]
+        ):
+            if char_combining:
+                chars.append(prev_char + char)
+            elif not prev_combining:
+                chars.append(prev_char)
+        if not combining[-1]:
+            chars.append(line[-1])
+    if not chars:
+        return '\t' + suffix
+    return suffix.join(chars) + suffix + '\t' + suffix
+
+
+def wordstr_boxes(line, width, height):
+    """
+    Return the box file content with a single WordStr box for line in display
+    order (for Indic and RTL scripts).
+    """
+    if not line:
+        return ''
+    return 'WordStr 0 0 %d %d 0 #%s\n\t 0 0 %d %d 0\n' % (
+        width,
+        height,
+        display_line(line),
+        width,
+        height,
+    )
+
+
+def syllable_boxes(line, width, height):
+    """
+    Return the box file content with one box per grapheme cluster of line,
+    each followed by an end of line box.
+    """
+    boxes = []
+    if line:
+        for syllable in graphemes.split_clusters(line):
+            boxes.append('%s 0 0 %d %d 0\n' % (syllable, width, height))
+            boxes.append('\t 0 0 %d %d 0\n' % (width, height))
+    return ''.join(boxes)
+
+
+def make_box(image, txt, box_function=char_boxes):
+    """
+    Return the box file content for a line image and its ground truth text
+    file, using box_function (one of the functions above).
+    """
+    width, height = imagesize.image_size(image)
+    line = groundtruth.read_gt_line(txt)
+    return box_function(line, width, height)
+
+
+def load_make_box(script):
+    """
+    Return the make_box function of a box generator script (like
+    generate_line_box.py), reloaded if the script changed.
+    """
+    mtime = os.stat(script).st_mtime_ns
+    cached = _make_box_functions.get(script)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    spec = importlib.util.spec_from_file_location(
+        '_box_script_%d' % len(_make_box_functions), script
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    _make_box_functions[script] = (mtime, module.make_box)
+    return module.make_box
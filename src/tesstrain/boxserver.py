@@ -0,0 +1,300 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Persistent box generation server on a Unix socket, with a thin client for
+the `%.box` recipes of the Makefile.
+
+Starting the box scripts for every line costs far more than generating the
+box itself. The server loads the box script once, keeps its imports warm and
+writes the requested `.box` files, one thread per connection, so it can serve
+`make -jN`. It exits after being idle for a while.
+
+The client (box_client.py, or the `box` command of this module) sends one
+request per run and starts the server if it is not running yet. If no server
+can be reached, it generates the box file itself.
+
+Protocol: one request line per connection with tab separated fields, either
+`box SCRIPT IMAGE TXT BOX`, `stats` or `stop`. The reply line starts with
+`ok` or `error`, followed by the server time for a box in milliseconds or a
+message.
+"""
+
+import argparse
+import math
+import os
+import socket
+import sys
+import time
+
+DEFAULT_IDLE_TIMEOUT = 300
+
+# Seconds the client waits for a newly started server.
+START_TIMEOUT = 10
+
+
+def _percentile(values, fraction):
+    # Nearest rank of the sorted values.
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def latency_summary(latencies):
+    """Return a one line summary of the request latencies (in seconds)."""
+    if not latencies:
+        return '0 requests'
+    values = sorted(latencies)
+    return '%d requests, mean %.2f ms, p50 %.2f ms, p95 %.2f ms, max %.2f ms' % (
+        len(values),
+        1000 * sum(values) / len(values),
+        1000 * _percentile(values, 0.5),
+        1000 * _percentile(values, 0.95),
+        1000 * values[-1],
+    )
+
+
+def write_box(script, image, txt, box):
+    """Generate box from image and txt with the make_box function of script."""
+    from tesstrain import boxes, groundtruth
+
+    groundtruth.write_atomic(box, boxes.load_make_box(script)(image, txt))
+
+
+def serve(socket_path, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """
+    Serve box requests on socket_path until the server was idle for
+    idle_timeout seconds or a stop request arrives. Returns without serving if
+    another server already owns socket_path.
+    """
+    import fcntl
+    import socketserver
+    import threading
+
+    lock = open(socket_path + '.lock', 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return
+    # Holding the lock, any existing socket is left over from a crashed server.
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    latencies = []
+    state = {'active': 0, 'last': time.monotonic(), 'stop': False}
+    state_lock = threading.Lock()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            reply = self.process(self.rfile.readline().decode('utf-8'))
+            self.wfile.write(reply.encode('utf-8'))
+
+        def process(self, request):
+            fields = request.rstrip('\n').split('\t')
+            if fields[0] == 'box' and len(fields) == 5:
+                start = time.perf_counter()
+                try:
+                    write_box(*fields[1:])
+                except Exception as e:
+                    print(e, file=sys.stderr)
+                    return 'error\t%s\n' % ' '.join(str(e).split())
+                latency = time.perf_counter() - start
+                with state_lock:
+                    latencies.append(latency)
+                print('%.2f ms %s' % (1000 * latency, fields[4]), file=sys.stderr)
+                return 'ok\t%.3f\n' % (1000 * latency)
+            if fields[0] == 'stats':
+                with state_lock:
+                    return 'ok\t%s\n' % latency_summary(latencies)
+            if fields[0] == 'stop':
+                state['stop'] = True
+                return 'ok\tstopping\n'
+            return 'error\tbad request\n'
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+        request_queue_size = 128
+        timeout = 1
+
+        def _done(self):
+            with state_lock:
+                state['active'] -= 1
+                state['last'] = time.monotonic()
+
+        def process_request(self, request, client_address):
+            # Counted here in the main loop, not by the handler thread, so that
+            # the idle check never sees an accepted request as inactive.
+            with state_lock:
+                state['active'] += 1
+            try:
+                super().process_request(request, client_address)
+            except BaseException:
+                self._done()
+                raise
+
+        def process_request_thread(self, request, client_address):
+            try:
+                super().process_request_thread(request, client_address)
+            finally:
+                self._done()
+
+    umask = os.umask(0o077)
+    try:
+        server = Server(socket_path, Handler)
+    finally:
+        os.umask(umask)
+    print('serving on %s (pid %d)' % (socket_path, os.getpid()), file=sys.stderr)
+    try:
+        while True:
+            server.handle_request()
+            with state_lock:
+                idle = not state['active'] and (
+                    state['stop'] or time.monotonic() - state['last'] > idle_timeout
+                )
+            if idle:
+                break
+    finally:
+        os.unlink(socket_path)
+        server.server_close()
+        lock.close()
+        print('stopped: %s' % latency_summary(latencies), file=sys.stderr)
+
+
+def request(socket_path, line):
+    """Send a request line to the server and return its reply line."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(line.encode('utf-8'))
+        chunks = []
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        sock.close()
+    reply = b''.join(chunks).decode('utf-8')
+    if not reply.endswith('\n'):
+        # The server went away (e.g. idle shutdown) while handling the request.
+        raise ConnectionResetError('no reply from %s' % socket_path)
+    return reply
+
+
+def start_server(socket_path, idle_timeout):
+    """Start a detached server process for socket_path."""
+    import subprocess
+
+    os.makedirs(os.path.dirname(socket_path) or '.', exist_ok=True)
+    with open(socket_path + '.log', 'a') as log:
+        subprocess.Popen(
+            [
+                sys.executable,
+                '-m',
+                'tesstrain.boxserver',
+                'serve',
+                '--socket',
+                socket_path,
+                '--idle',
+                str(idle_timeout),
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+
+
+def request_box(socket_path, script, image, txt, box, idle_timeout):
+    """
+    Let the server write box, starting it if needed. Falls back to generating
+    box in this process if no server can be reached. Returns the reply line.
+    """
+    line = '\t'.join(
+        ['box'] + [os.path.abspath(path) for path in (script, image, txt, box)]
+    ) + '\n'
+    if hasattr(socket, 'AF_UNIX'):
+        deadline = None
+        while True:
+            try:
+                return request(socket_path, line)
+            except OSError:
+                if deadline is None:
+                    start_server(socket_path, idle_timeout)
+                    deadline = time.monotonic() + START_TIMEOUT
+                elif time.monotonic() > deadline:
+                    break
+                time.sleep(0.05)
+    write_box(script, image, txt, box)
+    return 'ok\tlocal\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tesstrain.boxserver',
+        description='Persistent box generation server and its client.',
+    )
+    parser.add_argument(
+        'command',
+        choices=['box', 'serve', 'stats', 'stop'],
+        help='box: let the server write a .box file (starting it if needed); '
+        'serve: run the server; stats: show request latencies; '
+        'stop: stop the server',
+    )
+    parser.add_argument('--socket', required=True, help='Path of the Unix socket')
+    parser.add_argument(
+        '--idle',
+        type=int,
+        default=DEFAULT_IDLE_TIMEOUT,
+        help='Stop the server after this many idle seconds (default: %(default)s)',
+    )
+    parser.add_argument('--script', help='Box generator script (box command)')
+    parser.add_argument('-i', '--image', help='Image file (box command)')
+    parser.add_argument('-t', '--txt', help='Line text (GT) (box command)')
+    parser.add_argument('-o', '--box', help='Box file to write (box command)')
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        action='store_true',
+        help='Print the server time for the box (box command)',
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve(args.socket, args.idle)
+        return 0
+    if args.command == 'box':
+        if not (args.script and args.image and args.txt and args.box):
+            parser.error('box requires --script, --image, --txt and --box')
+        start = time.perf_counter()
+        reply = request_box(
+            args.socket, args.script, args.image, args.txt, args.box, args.idle
+        )
+        status, _, message = reply.rstrip('\n').partition('\t')
+        if status != 'ok':
+            print(message, file=sys.stderr)
+            return 1
+        if args.verbose:
+            print(
+                '%s: %s ms in server, %.2f ms in client'
+                % (args.box, message, 1000 * (time.perf_counter() - start)),
+                file=sys.stderr,
+            )
+        return 0
+    try:
+        reply = request(args.socket, args.command + '\n')
+    except OSError:
+        print('no box server on %s' % args.socket)
+        return 1
+    print(reply.rstrip('\n').partition('\t')[2])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -17,39 +17,174 @@ For a detailed description of the phases, see
 https://tesseract-ocr.github.io/tessdoc/Training-Tesseract.html.
 """
 
+import asyncio
+import collections
 import concurrent.futures
+import functools
+import json
 import logging
 import os
 import pathlib
+import re
 import shutil
+import statistics
 import subprocess
 import sys
+import threading
+import time
 from operator import itemgetter
 
 from tqdm import tqdm
 
+from tesstrain import groundtruth, tessapi
 from tesstrain.language_specific import VERTICAL_FONTS
 
 log = logging.getLogger(__name__)
 
+# Size of the chunks read from the output of a command.
+READ_SIZE = 64 * 1024
+
+# Longer output lines of a command are truncated in the log.
+MAX_LOG_LINE = 64 * 1024
+
+# Number of output lines of a command logged as an error if it fails.
+ERROR_LOG_LINES = 200
+
+# Programs run by the phases, which check_toolchain looks for before phase I.
+TOOLCHAIN = (
+    'text2image',
+    'tesseract',
+    'unicharset_extractor',
+    'set_unicharset_properties',
+    'combine_lang_model',
+)
+
 
 def err_exit(msg):
     log.critical(msg)
     sys.exit(1)
 
 
-def run_command(cmd, *args, env=None):
+class CommandError(Exception):
+    """A command run by run_command_async failed or timed out."""
+
+
+class CommandOutput:
     """
-    Helper function to run a command and append its output to a log. Aborts early if
-    the program file is not found.
+    Logs the output of a command line by line as it arrives, and keeps the
+    last ERROR_LOG_LINES lines to log as an error if the command fails.
+    """
+
+    def __init__(self, cmd):
+        self.log = logging.getLogger(cmd)
+        self.tail = collections.deque(maxlen=ERROR_LOG_LINES)
+        self.partial = b''
+
+    def feed(self, data):
+        """Log the complete lines in data, or the rest if data is empty."""
+        if not data:
+            if self.partial:
+                self._line(self.partial)
+            self.partial = b''
+            return
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()[:MAX_LOG_LINE]
+        for line in lines:
+            self._line(line)
+
+    def _line(self, line):
+        text = line[:MAX_LOG_LINE].decode('utf-8', errors='replace').rstrip('\r')
+        self.log.debug(text)
+        self.tail.append(text)
+
+    def log_error(self):
+        if self.tail:
+            self.log.error('\n'.join(self.tail))
+
+
+@functools.lru_cache(maxsize=None)
+def which_command(cmd):
+    """
+    Return the path of the program cmd in PATH, or in the api/ or training/
+    directory of a tesseract build in the current directory, or None if it
+    is not found. The result is cached, so every program is looked for once.
     """
     for d in ('', 'api/', 'training/'):
-        testcmd = shutil.which(f'{d}{cmd}')
-        if shutil.which(testcmd):
-            cmd = testcmd
-            break
-    if not shutil.which(cmd):
-        err_exit(f'{cmd} not found')
+        path = shutil.which(f'{d}{cmd}')
+        if path:
+            return path
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def command_version(path):
+    """
+    Return the first line of the output of `path --version` (like
+    'tesseract 5.3.0'), or None if it fails.
+    """
+    try:
+        proc = subprocess.run(
+            [path, '--version'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            timeout=60,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    lines = proc.stdout.decode('utf-8', errors='replace').strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        return None
+    return lines[0].strip()
+
+
+def toolchain_programs(ctx):
+    """Return the programs of TOOLCHAIN which a run with ctx executes."""
+    skipped = set()
+    if not ctx.linedata:
+        # Phase E (tesseract) and make_lstmdata (combine_lang_model) only
+        # run for line data.
+        skipped.update(('tesseract', 'combine_lang_model'))
+    return [program for program in TOOLCHAIN if program not in skipped]
+
+
+def check_toolchain(programs=TOOLCHAIN):
+    """
+    Find the programs and their versions before anything is run, and abort
+    if one of them is missing. Logs and returns the (path, version) of each
+    program. Warns if the programs are from different tesseract versions.
+    """
+    missing = [program for program in programs if which_command(program) is None]
+    if missing:
+        err_exit(f"Programs not found: {', '.join(missing)}")
+    paths = [which_command(program) for program in programs]
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        versions = list(executor.map(command_version, paths))
+
+    toolchain = {}
+    numbers = {}
+    for program, path, version in zip(programs, paths, versions):
+        toolchain[program] = (path, version)
+        log.info(f"Using {path} ({version or 'unknown version'})")
+        match = re.search(r'\d+\.\d+(?:\.\d+)?', version or '')
+        if match:
+            numbers[program] = match.group(0)
+    if len(set(numbers.values())) > 1:
+        log.warning(
+            'The programs are from different tesseract versions: '
+            + ', '.join(f'{program} {n}' for program, n in numbers.items())
+        )
+    return toolchain
+
+
+def find_command(cmd, args):
+    """
+    Return the path of the program cmd (or None if it is not found) and args
+    as a list of arguments for it.
+    """
+    path = which_command(cmd)
+    if path is None:
+        return None, None
+    cmd = path
 
     log.debug(f'Running {cmd}')
     args = list(args)
@@ -59,23 +194,148 @@ def run_command(cmd, *args, env=None):
         # TypeError: argument of type 'WindowsPath' is not iterable
         if isinstance(arg, pathlib.WindowsPath):
             args[idx] = str(arg)
+    return cmd, args
+
+
+def run_command(cmd, *args, env=None, timeout=None):
+    """
+    Helper function to run a command and append its output to a log. Aborts early if
+    the program file is not found.
 
-    proc = subprocess.run(
+    The output is logged line by line while the command runs. Aborts if the command
+    fails or (with timeout) runs for more than timeout seconds.
+    """
+    path, args = find_command(cmd, args)
+    if path is None:
+        err_exit(f'{cmd} not found')
+    cmd = path
+
+    output = CommandOutput(cmd)
+    proc = subprocess.Popen(
         [cmd, *args], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env
     )
-    proclog = logging.getLogger(cmd)
-    if proc.returncode == 0:
-        proclog.debug(proc.stdout.decode('utf-8', errors='replace'))
-    else:
-        try:
-            proclog.error(proc.stdout.decode('utf-8', errors='replace'))
-        except Exception as e:
-            proclog.error(e)
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        proc.kill()
+
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer is not None:
+        timer.start()
+    try:
+        with proc:
+            for data in iter(lambda: proc.stdout.read1(READ_SIZE), b''):
+                output.feed(data)
+            output.feed(b'')
+    finally:
+        if timer is not None:
+            timer.cancel()
+    if timed_out.is_set():
+        output.log_error()
+        err_exit(f'Program {cmd} timed out after {timeout} s. Abort.')
+    if proc.returncode != 0:
+        output.log_error()
         err_exit(
             f'Program {cmd} failed with return code {proc.returncode}. Abort.'
         )
 
 
+def run_event_loop(main):
+    """
+    Run the coroutine main with asyncio.run(). On Linux, the processes are
+    waited for with pidfds instead of a thread for each (the default since
+    Python 3.12).
+    """
+    if (
+        sys.version_info < (3, 12)
+        and hasattr(asyncio, 'PidfdChildWatcher')
+        and threading.current_thread() is threading.main_thread()
+    ):
+        try:
+            os.close(os.pidfd_open(os.getpid()))
+        except (AttributeError, OSError):
+            pass
+        else:
+            asyncio.set_child_watcher(asyncio.PidfdChildWatcher())
+    return asyncio.run(main)
+
+
+def _kill(proc):
+    """Kill the asyncio process proc unless it has already exited."""
+    if proc.returncode is None:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+
+
+async def _reap(proc):
+    """Kill proc if it is running and wait for the end of it and its output."""
+    _kill(proc)
+    await proc.stdout.read()
+    await proc.wait()
+
+
+async def _await_uncancelled(task):
+    """
+    Await task to the end, even if the caller is cancelled meanwhile (which
+    is raised afterwards).
+    """
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        await task
+        raise
+
+
+async def run_command_async(cmd, *args, env=None, timeout=None):
+    """
+    Coroutine version of run_command, which raises CommandError instead of
+    aborting, so that many commands can run in one event loop without a
+    thread for each. The command is killed if the coroutine is cancelled.
+    """
+    path, args = find_command(cmd, args)
+    if path is None:
+        raise CommandError(f'{cmd} not found')
+    cmd = path
+
+    output = CommandOutput(cmd)
+    # Cancelling asyncio while it starts a process can make it wait for the
+    # process forever, so the process is started (and killed) uncancelled.
+    start = asyncio.ensure_future(
+        asyncio.create_subprocess_exec(
+            cmd, *args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env
+        )
+    )
+    try:
+        proc = await _await_uncancelled(start)
+    except asyncio.CancelledError:
+        await _reap(start.result())
+        raise
+
+    async def communicate():
+        while True:
+            data = await proc.stdout.read(READ_SIZE)
+            output.feed(data)
+            if not data:
+                break
+        await proc.wait()
+
+    try:
+        await asyncio.wait_for(communicate(), timeout or None)
+    except asyncio.TimeoutError:
+        output.log_error()
+        raise CommandError(f'Program {cmd} timed out after {timeout} s') from None
+    finally:
+        await _await_uncancelled(asyncio.ensure_future(_reap(proc)))
+    if proc.returncode != 0:
+        output.log_error()
+        raise CommandError(
+            f'Program {cmd} failed with return code {proc.returncode}'
+        )
+
+
 def check_file_readable(*filenames):
     """
     Check if all the given files exist, or exit otherwise.
@@ -132,12 +392,12 @@ def make_outbase(ctx, fontname, exposure):
     )
 
 
-def generate_font_image(ctx, font, exposure, char_spacing):
+async def generate_font_image(ctx, font, exposure, char_spacing):
     """
     Helper function for `phaseI_generate_image`.
 
     Generates the image for a single language/font combination in a way that can be run
-    in parallel.
+    in parallel (as a coroutine).
     """
     log.info(f'Rendering using {font}')
     fontname = make_fontname(font)
@@ -163,13 +423,14 @@ def generate_font_image(ctx, font, exposure, char_spacing):
     if font in vertical_fonts:
         common_args.append('--writing_mode=vertical-upright')
 
-    run_command(
+    await run_command_async(
         'text2image',
         *common_args,
         f'--font={font}',
         f'--text={ctx.training_text}',
         f'--ptsize={ctx.ptsize}',
         *ctx.text2image_extra_args,
+        timeout=ctx.command_timeout,
     )
 
     check_file_readable(str(outbase) + '.box', str(outbase) + '.tif')
@@ -179,7 +440,7 @@ def generate_font_image(ctx, font, exposure, char_spacing):
         and pathlib.Path(ctx.train_ngrams_file).exists()
     ):
         log.info(f'Extracting font properties of {font}')
-        run_command(
+        await run_command_async(
             'text2image',
             *common_args,
             f'--font={font}',
@@ -187,82 +448,203 @@ def generate_font_image(ctx, font, exposure, char_spacing):
             f'--text={ctx.train_ngrams_file}',
             f'--only_extract_font_properties',
             f'--ptsize=32',
+            timeout=ctx.command_timeout,
         )
         check_file_readable(str(outbase) + '.fontinfo')
     return f'{font}-{exposure}'
 
 
+def render_history_file(ctx):
+    """Return the file with the render durations of earlier runs."""
+    return pathlib.Path(ctx.output_dir) / 'render_durations.json'
+
+
+def load_render_durations(ctx):
+    """
+    Return a dict with the duration in seconds of rendering each font and
+    exposure of ctx.lang_code in earlier runs, keyed by (font, exposure).
+    """
+    try:
+        history = json.loads(render_history_file(ctx).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    return {
+        (font, exposure): duration
+        for lang_code, font, exposure, duration in history.get('durations', [])
+        if lang_code == ctx.lang_code
+    }
+
+
+def save_render_durations(ctx, durations):
+    """Add durations (as returned by load_render_durations) to the history."""
+    path = render_history_file(ctx)
+    try:
+        history = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        history = {}
+    merged = {
+        (lang_code, font, exposure): duration
+        for lang_code, font, exposure, duration in history.get('durations', [])
+    }
+    for (font, exposure), duration in durations.items():
+        merged[(ctx.lang_code, font, exposure)] = round(duration, 3)
+    entries = [[*key, duration] for key, duration in sorted(merged.items())]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    groundtruth.write_atomic(
+        path, json.dumps({'durations': entries}, ensure_ascii=False) + '\n'
+    )
+
+
+def schedule_render_jobs(jobs, durations):
+    """
+    Return the (font, exposure) jobs sorted longest expected first. A job
+    without a recorded duration is expected to take as long as the same font
+    with another exposure, or as long as the slowest job otherwise.
+    """
+    by_font = {}
+    for (font, _), duration in durations.items():
+        by_font[font] = max(duration, by_font.get(font, 0))
+    slowest = max(durations.values(), default=0)
+
+    def expected(job):
+        if job in durations:
+            return durations[job]
+        return by_font.get(job[0], slowest)
+
+    return sorted(jobs, key=expected, reverse=True)
+
+
+def write_train_ngrams(ctx):
+    """
+    Parse the .bigram_freqs file and compose a .train_ngrams file with text
+    for tesseract to recognize during training.
+    """
+    # Take only the ngrams whose combined weight accounts for 95% of all the
+    # bigrams in the language.
+    lines = (
+        pathlib.Path(ctx.bigram_freqs_file)
+        .read_text(encoding='utf-8')
+        .split('\n')
+    )
+    records = (line.split() for line in lines)
+    p = 0.99
+    ngram_frac = p * sum(int(rec[1]) for rec in records if len(rec) >= 2)
+
+    with pathlib.Path(ctx.train_ngrams_file).open('w', encoding='utf-8') as f:
+        cumsum = 0
+        for bigram, count in sorted(records, key=itemgetter(1), reverse=True):
+            if cumsum > ngram_frac:
+                break
+            f.write(bigram + ' ')
+            cumsum += count
+
+    check_file_readable(ctx.train_ngrams_file)
+
+
+async def cancel_tasks(tasks):
+    """
+    Cancel the tasks which are not done and wait for them, so that they can
+    kill their processes before the event loop is closed.
+    """
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _timed_font_image(semaphore, ctx, font, exposure, char_spacing):
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            await generate_font_image(ctx, font, exposure, char_spacing)
+        except SystemExit:
+            # check_file_readable has logged the missing file. Raise an
+            # exception for the caller to cancel the other tasks.
+            raise CommandError(f'text2image failed for {font}') from None
+        return (font, exposure), time.perf_counter() - start
+
+
+async def _render_all(ctx, jobs, par_factor, char_spacing, pbar):
+    semaphore = asyncio.Semaphore(par_factor)
+    # The tasks acquire the semaphore in the order they are created in.
+    tasks = [
+        asyncio.ensure_future(
+            _timed_font_image(semaphore, ctx, font, exposure, char_spacing)
+        )
+        for font, exposure in jobs
+    ]
+    durations = {}
+    try:
+        for future in asyncio.as_completed(tasks):
+            job, duration = await future
+            durations[job] = duration
+            pbar.update(1)
+    finally:
+        await cancel_tasks(tasks)
+    return durations
+
+
 def phase_I_generate_image(ctx, par_factor=None):
     """
     Phase I: Generate (I)mages from training text for each font.
+
+    All fonts and exposures are rendered in one event loop with up to
+    par_factor text2image processes at once (default: ctx.par_factor),
+    slowest first according to the durations of earlier runs, so that no
+    slow font holds up the others at the end.
     """
     if not par_factor or par_factor <= 0:
-        par_factor = 1
+        par_factor = ctx.par_factor if ctx.par_factor > 0 else 1
 
     log.info('=== Phase I: Generating training images ===')
-    check_file_readable(ctx.training_text)
+    jobs = prepare_render_jobs(ctx)
     char_spacing = 0.0
-
-    for exposure in ctx.exposures:
-        if (
-            ctx.extract_font_properties
-            and pathlib.Path(ctx.bigram_freqs_file).exists()
-        ):
-            # Parse .bigram_freqs file and compose a .train_ngrams file with text
-            # for tesseract to recognize during training. Take only the ngrams whose
-            # combined weight accounts for 95% of all the bigrams in the language.
-            lines = (
-                pathlib.Path(ctx.bigram_freqs_file)
-                .read_text(encoding='utf-8')
-                .split('\n')
-            )
-            records = (line.split() for line in lines)
-            p = 0.99
-            ngram_frac = p * sum(
-                int(rec[1]) for rec in records if len(rec) >= 2
+    with tqdm(total=len(jobs)) as pbar:
+        try:
+            durations = run_event_loop(
+                _render_all(ctx, jobs, par_factor, char_spacing, pbar)
             )
-
-            with pathlib.Path(ctx.train_ngrams_file).open(
-                'w', encoding='utf-8'
-            ) as f:
-                cumsum = 0
-                for bigram, count in sorted(
-                    records, key=itemgetter(1), reverse=True
-                ):
-                    if cumsum > ngram_frac:
-                        break
-                    f.write(bigram + ' ')
-                    cumsum += count
-
-            check_file_readable(ctx.train_ngrams_file)
-
-        with tqdm(
-            total=len(ctx.fonts)
-        ) as pbar, concurrent.futures.ThreadPoolExecutor(
-            max_workers=par_factor
-        ) as executor:
-            futures = [
-                executor.submit(
-                    generate_font_image, ctx, font, exposure, char_spacing
-                )
-                for font in ctx.fonts
-            ]
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    future.result()
-                except Exception as exc:
-                    err_exit('Failed while generating images ' + str(exc))
-                else:
-                    pbar.update(1)
-
-        # Check that each process was successful.
-        for font in ctx.fonts:
-            fontname = make_fontname(font)
-            outbase = make_outbase(ctx, fontname, exposure)
-            check_file_readable(str(outbase) + '.box', str(outbase) + '.tif')
+        except Exception as exc:
+            err_exit('Failed while generating images ' + str(exc))
+    finish_render_jobs(ctx, jobs, durations)
     return
 
 
+def prepare_render_jobs(ctx):
+    """
+    Check the training text, write the training ngrams if needed and return
+    the (font, exposure) pairs to render, slowest first.
+    """
+    check_file_readable(ctx.training_text)
+    if (
+        ctx.extract_font_properties
+        and pathlib.Path(ctx.bigram_freqs_file).exists()
+    ):
+        write_train_ngrams(ctx)
+
+    history = load_render_durations(ctx)
+    return schedule_render_jobs(
+        [(font, exposure) for exposure in ctx.exposures for font in ctx.fonts],
+        history,
+    )
+
+
+def finish_render_jobs(ctx, jobs, durations):
+    """
+    Save the render durations of this run and check that every job produced
+    its .box and .tif file.
+    """
+    try:
+        save_render_durations(ctx, durations)
+    except OSError as e:
+        log.warning(f'Could not save the render durations: {e}')
+
+    # Check that each process was successful.
+    for font, exposure in jobs:
+        fontname = make_fontname(font)
+        outbase = make_outbase(ctx, fontname, exposure)
+        check_file_readable(str(outbase) + '.box', str(outbase) + '.tif')
+
+
 def phase_UP_generate_unicharset(ctx):
     """
     Phase UP: Generate (U)nicharset and (P)roperties file.
@@ -303,15 +685,52 @@ def phase_UP_generate_unicharset(ctx):
     check_file_readable(ctx.xheights_file)
 
 
-def phase_E_extract_features(ctx, box_config, ext):
+def available_cpus():
+    """Return the number of CPUs this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def available_memory():
+    """Return the available physical memory in bytes, or None if unknown."""
+    try:
+        with open('/proc/meminfo', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def extract_workers(ctx, num_images):
     """
-    Phase E: (E)xtract .tr feature files from .tif/.box files.
+    Return the number of parallel tesseract processes for feature extraction:
+    ctx.extract_jobs if set, else one per available CPU, but no more than
+    fit into the available memory with ctx.extract_memory_mb each.
     """
-    log.info(f'=== Phase E: Generating {ext} files ===')
+    if ctx.extract_jobs and ctx.extract_jobs > 0:
+        return ctx.extract_jobs
+    workers = available_cpus()
+    memory = available_memory()
+    if memory and ctx.extract_memory_mb and ctx.extract_memory_mb > 0:
+        workers = min(workers, memory // (ctx.extract_memory_mb * 1024 * 1024))
+    return max(1, min(workers, num_images))
 
-    img_files = list(pathlib.Path(ctx.training_dir).glob('*.exp*.tif'))
-    log.debug(img_files)
 
+def make_extractor(ctx, box_config, workers):
+    """
+    Return (extract, close) where the coroutine function extract(img_file)
+    runs tesseract with box_config (and the language config, if there is
+    one) on img_file and returns its duration, and close() has to be called
+    when all images are done. With the api backend, up to workers images are
+    processed by libtesseract in threads at once.
+    """
     # Use any available language-specific configs.
     config = ''
     testconfig = (
@@ -328,31 +747,115 @@ def phase_E_extract_features(ctx, box_config, ext):
 
     log.info(f"Using TESSDATA_PREFIX={tessdata_environ['TESSDATA_PREFIX']}")
 
-    with tqdm(
-        total=len(img_files)
-    ) as pbar, concurrent.futures.ThreadPoolExecutor(
-        max_workers=2
-    ) as executor:
-        futures = []
-        for img_file in img_files:
-            future = executor.submit(
-                run_command,
-                'tesseract',
-                img_file,
-                pathlib.Path(img_file).with_suffix(''),
-                *box_config,
-                config,
-                env=tessdata_environ,
+    # With the api backend, the images are processed by initialized
+    # libtesseract handles (one per worker thread) instead of a tesseract
+    # process per image.
+    api = None
+    executor = None
+    if ctx.extract_backend == 'api':
+        api = tessapi.ApiPool.create(
+            datapath=ctx.tessdata_dir, configs=[*box_config, config]
+        )
+        if api is None:
+            log.warning('libtesseract not found, running tesseract instead')
+        else:
+            log.info(f'Using libtesseract {tessapi.version()}')
+            log.warning(
+                'The api backend is experimental, check its .lstmf files '
+                'against the ones of the subprocess backend'
             )
-            futures.append(future)
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
 
-        for future in concurrent.futures.as_completed(futures):
+    async def extract(img_file):
+        start = time.perf_counter()
+        outbase = pathlib.Path(img_file).with_suffix('')
+        if api is not None:
             try:
-                future.result()
-            except Exception as exc:
-                err_exit('Failed while extracting features: ' + str(exc))
-            else:
+                await asyncio.get_event_loop().run_in_executor(
+                    executor, api.process, img_file, outbase
+                )
+                return time.perf_counter() - start
+            except tessapi.TessApiError as e:
+                log.warning(f'{e}, running tesseract instead')
+        await run_command_async(
+            'tesseract',
+            img_file,
+            outbase,
+            *box_config,
+            config,
+            env=tessdata_environ,
+            timeout=ctx.command_timeout,
+        )
+        return time.perf_counter() - start
+
+    def close():
+        if executor is not None:
+            executor.shutdown()
+        if api is not None:
+            api.close()
+
+    return extract, close
+
+
+async def _timed_extract(semaphore, extract, img_file):
+    async with semaphore:
+        return img_file, await extract(img_file)
+
+
+def log_extract_summary(durations, wall, workers):
+    """Log how busy the workers were while extracting features."""
+    if not durations:
+        return
+    # The busy time of the workers shows whether the pool was saturated.
+    busy = sum(durations)
+    log.info(
+        f'Extracted {len(durations)} images in {wall:.1f} s, '
+        f'{busy / wall:.1f} of {workers} workers busy on average '
+        f'({100 * busy / (wall * workers):.0f}%), per image '
+        f'{min(durations):.2f}/{statistics.median(durations):.2f}/'
+        f'{max(durations):.2f} s (min/median/max)'
+    )
+
+
+def phase_E_extract_features(ctx, box_config, ext):
+    """
+    Phase E: (E)xtract .tr feature files from .tif/.box files.
+    """
+    log.info(f'=== Phase E: Generating {ext} files ===')
+
+    img_files = list(pathlib.Path(ctx.training_dir).glob('*.exp*.tif'))
+    log.debug(img_files)
+
+    workers = extract_workers(ctx, len(img_files))
+    extract, close = make_extractor(ctx, box_config, workers)
+    log.info(f'Extracting features with {workers} workers')
+    durations = []
+
+    async def extract_all(pbar):
+        semaphore = asyncio.Semaphore(workers)
+        tasks = [
+            asyncio.ensure_future(_timed_extract(semaphore, extract, img_file))
+            for img_file in img_files
+        ]
+        try:
+            for future in asyncio.as_completed(tasks):
+                try:
+                    img_file, duration = await future
+                except Exception as exc:
+                    err_exit('Failed while extracting features: ' + str(exc))
+                log.debug(f'Extracted {img_file} in {duration:.2f} s')
+                durations.append(duration)
                 pbar.update(1)
+        finally:
+            await cancel_tasks(tasks)
+
+    start = time.perf_counter()
+    with tqdm(total=len(img_files)) as pbar:
+        try:
+            run_event_loop(extract_all(pbar))
+        finally:
+            close()
+    log_extract_summary(durations, time.perf_counter() - start, workers)
     # Check that all the output files were produced.
     for img_file in img_files:
         check_file_readable(pathlib.Path(img_file.with_suffix('.' + ext)))
@@ -360,6 +863,112 @@ def phase_E_extract_features(ctx, box_config, ext):
     return
 
 
+def phase_IUE_pipeline(ctx, box_config, ext, par_factor=None):
+    """
+    Phases I, UP and E as a pipeline: the features of each rendered image
+    are extracted as soon as it is rendered, while the other fonts and
+    exposures are still rendering, with up to extract_workers() tesseract
+    processes besides the par_factor text2image processes.
+
+    Feature extraction does not use the unicharset, so phase UP runs as soon
+    as the last image is rendered (it needs all the .box files), while the
+    features of the last images are still being extracted.
+    """
+    if not par_factor or par_factor <= 0:
+        par_factor = ctx.par_factor if ctx.par_factor > 0 else 1
+
+    log.info(
+        f'=== Phases I and E: Rendering images and generating {ext} files ==='
+    )
+    jobs = prepare_render_jobs(ctx)
+    char_spacing = 0.0
+    workers = extract_workers(ctx, len(jobs))
+    extract, close = make_extractor(ctx, box_config, workers)
+    log.info(
+        f'Rendering with {par_factor} and extracting features '
+        f'with {workers} workers'
+    )
+    render_durations = {}
+    durations = []
+    img_files = []
+    walls = {}
+
+    async def pipeline(pbar):
+        render_semaphore = asyncio.Semaphore(par_factor)
+        extract_semaphore = asyncio.Semaphore(workers)
+        renders = [
+            asyncio.ensure_future(
+                _timed_font_image(
+                    render_semaphore, ctx, font, exposure, char_spacing
+                )
+            )
+            for font, exposure in jobs
+        ]
+        extractions = []
+        try:
+            for future in asyncio.as_completed(renders):
+                try:
+                    (font, exposure), duration = await future
+                except Exception as exc:
+                    err_exit('Failed while generating images ' + str(exc))
+                render_durations[font, exposure] = duration
+                pbar.update(1)
+                outbase = make_outbase(ctx, make_fontname(font), exposure)
+                img_file = pathlib.Path(str(outbase) + '.tif')
+                check_file_readable(str(outbase) + '.box', img_file)
+                img_files.append(img_file)
+                extractions.append(
+                    asyncio.ensure_future(
+                        _timed_extract(extract_semaphore, extract, img_file)
+                    )
+                )
+            up_start = time.perf_counter()
+            walls['rendering'] = up_start - start
+
+            # Phase UP runs its commands in a thread while the event loop
+            # keeps extracting features.
+            await asyncio.get_event_loop().run_in_executor(
+                None, phase_UP_generate_unicharset, ctx
+            )
+            walls['unicharset'] = time.perf_counter() - up_start
+
+            for future in asyncio.as_completed(extractions):
+                try:
+                    img_file, duration = await future
+                except Exception as exc:
+                    err_exit('Failed while extracting features: ' + str(exc))
+                log.debug(f'Extracted {img_file} in {duration:.2f} s')
+                durations.append(duration)
+                pbar.update(1)
+        finally:
+            await cancel_tasks(renders + extractions)
+
+    start = time.perf_counter()
+    with tqdm(total=2 * len(jobs)) as pbar:
+        try:
+            run_event_loop(pipeline(pbar))
+        finally:
+            close()
+    wall = time.perf_counter() - start
+    finish_render_jobs(ctx, jobs, render_durations)
+    log_extract_summary(durations, wall, workers)
+    # Check that all the output files were produced.
+    for img_file in img_files:
+        check_file_readable(pathlib.Path(img_file.with_suffix('.' + ext)))
+
+    # One after the other, the phases would take at least the rendering
+    # time, the time of phase UP and the extraction time with all workers
+    # busy.
+    extract_wall = sum(durations) / workers
+    log.info(
+        f'Pipeline took {wall:.1f} s, the phases would take at least '
+        f"{walls['rendering'] + walls['unicharset'] + extract_wall:.1f} s "
+        f"(rendering {walls['rendering']:.1f} s, unicharset "
+        f"{walls['unicharset']:.1f} s, extraction {extract_wall:.1f} s)"
+    )
+    return
+
+
 def make_lstmdata(ctx):
     log.info('=== Constructing LSTM training data ===')
     lang_prefix = f'{ctx.langdata_dir}/{ctx.lang_code}/{ctx.lang_code}'
@@ -0,0 +1,494 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Table driven segmentation of text into (extended) grapheme clusters.
+
+This follows the rules of Unicode Standard Annex #29, including the Indic
+conjunct rule (GB9c) with the Indic_Conjunct_Break property: a consonant
+which follows a consonant and a linker (a virama, optionally surrounded by
+further marks or a zero width joiner) stays in the same cluster. The
+Indic_Conjunct_Break values, the prepend characters and the marks whose
+grapheme break property differs from their general category are taken from
+the Unicode 17.0 character database. All other properties are derived from
+unicodedata, so they follow the Unicode version of Python. Extended
+pictographic characters are recognized by their main code point blocks only.
+
+The grapheme break property of each character is computed once from
+unicodedata and then looked up in a table, so segmenting large corpora does
+not call into unicodedata for every character.
+"""
+
+import re
+import unicodedata
+
+# Grapheme break properties (with Consonant and Linker for GB9c).
+OTHER = 0
+CR = 1
+LF = 2
+CONTROL = 3
+EXTEND = 4
+ZWJ = 5
+SPACING_MARK = 6
+PREPEND = 7
+REGIONAL_INDICATOR = 8
+HANGUL_L = 9
+HANGUL_V = 10
+HANGUL_T = 11
+HANGUL_LV = 12
+HANGUL_LVT = 13
+PICTOGRAPHIC = 14
+LINKER = 15
+CONSONANT = 16
+
+ZERO_WIDTH_JOINER = '\u200d'
+ZERO_WIDTH_NON_JOINER = '\u200c'
+
+# Letters which are spacing marks for grapheme segmentation (Thai, Lao SARA AM).
+SPACING_MARK_LETTERS = frozenset('\u0e33\u0eb3')
+
+# Characters with Grapheme_Cluster_Break=Extend besides the nonspacing and
+# enclosing marks, ZWNJ, emoji modifiers and tags (mostly vowel signs which
+# are spacing marks by their general category).
+EXTEND_CHARS = frozenset(
+    '\u09be\u09d7\u0b3e\u0b57\u0bbe\u0bd7\u0cc0\u0cc2\u0cc7\u0cc8\u0cca'
+    '\u0ccb\u0cd5\u0cd6\u0d3e\u0d57\u0dcf\u0ddf\u1715\u1734\u1b35\u1b3b'
+    '\u1b3d\u1b43\u1b44\u1baa\u1bf2\u1bf3\u302e\u302f\ua953\ua9c0\uff9e'
+    '\uff9f\U000111c0\U00011235\U0001133e\U0001134d\U00011357\U000113b8'
+    '\U000113c2\U000113c5\U000113c7\U000113c8\U000113c9\U000113cf\U000114b0'
+    '\U000114bd\U000115af\U000116b6\U00011930\U0001193d\U00011f41\U00016ff0'
+    '\U00016ff1\U0001d165\U0001d166\U0001d16d\U0001d16e\U0001d16f\U0001d170'
+    '\U0001d171\U0001d172\U0001d250\U0001d251\U0001d252\U0001d25f\U0001d280'
+    '\U0001d281'
+)
+
+PREPEND_CHARS = frozenset(
+    '\u0600\u0601\u0602\u0603\u0604\u0605\u06dd\u070f\u0890\u0891\u08e2'
+    '\u0d4e\U000110bd\U000110cd\U000111c2\U000111c3\U000113d1\U0001193f'
+    '\U00011941\U00011a84\U00011a85\U00011a86\U00011a87\U00011a88\U00011a89'
+    '\U00011d46\U00011f02'
+)
+
+# Spacing marks which do not join the preceding character
+# (Grapheme_Cluster_Break=Other).
+OTHER_MARKS = frozenset(
+    '\u102b\u102c\u1038\u1062\u1063\u1064\u1067\u1068\u1069\u106a\u106b'
+    '\u106c\u106d\u1083\u1087\u1088\u1089\u108a\u108b\u108c\u108f\u109a'
+    '\u109b\u109c\u1a61\u1a63\u1a64\uaa7b\uaa7d\U00011720\U00011721'
+)
+
+# Main blocks of Extended_Pictographic characters.
+PICTOGRAPHIC_RANGES = (
+    (0x00A9, 0x00A9),
+    (0x00AE, 0x00AE),
+    (0x203C, 0x203C),
+    (0x2049, 0x2049),
+    (0x2122, 0x2122),
+    (0x2139, 0x2139),
+    (0x2194, 0x21AA),
+    (0x231A, 0x23FF),
+    (0x24C2, 0x24C2),
+    (0x25AA, 0x25FE),
+    (0x2600, 0x27BF),
+    (0x2934, 0x2935),
+    (0x2B05, 0x2B55),
+    (0x3030, 0x3030),
+    (0x303D, 0x303D),
+    (0x3297, 0x3299),
+    (0x1F000, 0x1F0FF),
+    (0x1F10D, 0x1F10F),
+    (0x1F12F, 0x1F12F),
+    (0x1F16C, 0x1F171),
+    (0x1F17E, 0x1F17F),
+    (0x1F18E, 0x1F18E),
+    (0x1F191, 0x1F19A),
+    (0x1F1AD, 0x1F1E5),
+    (0x1F201, 0x1F20F),
+    (0x1F21A, 0x1F21A),
+    (0x1F22F, 0x1F22F),
+    (0x1F232, 0x1F23A),
+    (0x1F23C, 0x1F23F),
+    (0x1F249, 0x1F3FA),
+    (0x1F400, 0x1F53D),
+    (0x1F546, 0x1F64F),
+    (0x1F680, 0x1F6FF),
+    (0x1F774, 0x1F77F),
+    (0x1F7D5, 0x1F7FF),
+    (0x1F80C, 0x1F80F),
+    (0x1F848, 0x1F84F),
+    (0x1F85A, 0x1F85F),
+    (0x1F888, 0x1F88F),
+    (0x1F8AE, 0x1F8FF),
+    (0x1F90C, 0x1F93A),
+    (0x1F93C, 0x1F945),
+    (0x1F947, 0x1FAFF),
+    (0x1FC00, 0x1FFFD),
+)
+
+# Characters with Indic_Conjunct_Break=Linker.
+INCB_LINKERS = frozenset(
+    '\u094d\u09cd\u0acd\u0b4d\u0c4d\u0d4d\u1039\u17d2\u1a60\u1b44\u1bab'
+    '\u1cf5\u1cf6\ua9c0\uaaf6\U00010a3f\U00011133\U000113d0\U0001193e'
+    '\U00011a3a\U00011a47\U00011a99\U00011f42'
+)
+
+# Characters with Indic_Conjunct_Break=Consonant.
+INCB_CONSONANT_RANGES = (
+    (0x0915, 0x0939),
+    (0x0958, 0x095F),
+    (0x0978, 0x097F),
+    (0x0995, 0x09A8),
+    (0x09AA, 0x09B0),
+    (0x09B2, 0x09B2),
+    (0x09B6, 0x09B9),
+    (0x09DC, 0x09DD),
+    (0x09DF, 0x09DF),
+    (0x09F0, 0x09F1),
+    (0x0A95, 0x0AA8),
+    (0x0AAA, 0x0AB0),
+    (0x0AB2, 0x0AB3),
+    (0x0AB5, 0x0AB9),
+    (0x0AF9, 0x0AF9),
+    (0x0B15, 0x0B28),
+    (0x0B2A, 0x0B30),
+    (0x0B32, 0x0B33),
+    (0x0B35, 0x0B39),
+    (0x0B5C, 0x0B5D),
+    (0x0B5F, 0x0B5F),
+    (0x0B71, 0x0B71),
+    (0x0C15, 0x0C28),
+    (0x0C2A, 0x0C39),
+    (0x0C58, 0x0C5A),
+    (0x0D15, 0x0D3A),
+    (0x1000, 0x102A),
+    (0x103F, 0x103F),
+    (0x1050, 0x1055),
+    (0x105A, 0x105D),
+    (0x1061, 0x1061),
+    (0x1065, 0x1066),
+    (0x106E, 0x1070),
+    (0x1075, 0x1081),
+    (0x108E, 0x108E),
+    (0x1780, 0x17B3),
+    (0x1A20, 0x1A54),
+    (0x1B0B, 0x1B0C),
+    (0x1B13, 0x1B33),
+    (0x1B45, 0x1B4C),
+    (0x1B83, 0x1BA0),
+    (0x1BAE, 0x1BAF),
+    (0x1BBB, 0x1BBD),
+    (0xA989, 0xA98B),
+    (0xA98F, 0xA9B2),
+    (0xA9E0, 0xA9E4),
+    (0xA9E7, 0xA9EF),
+    (0xA9FA, 0xA9FE),
+    (0xAA60, 0xAA6F),
+    (0xAA71, 0xAA73),
+    (0xAA7A, 0xAA7A),
+    (0xAA7E, 0xAA7F),
+    (0xAAE0, 0xAAEA),
+    (0xABC0, 0xABDA),
+    (0x10A00, 0x10A00),
+    (0x10A10, 0x10A13),
+    (0x10A15, 0x10A17),
+    (0x10A19, 0x10A35),
+    (0x11103, 0x11126),
+    (0x11144, 0x11144),
+    (0x11147, 0x11147),
+    (0x11380, 0x11389),
+    (0x1138B, 0x1138B),
+    (0x1138E, 0x1138E),
+    (0x11390, 0x113B5),
+    (0x11900, 0x11906),
+    (0x11909, 0x11909),
+    (0x1190C, 0x11913),
+    (0x11915, 0x11916),
+    (0x11918, 0x1192F),
+    (0x11A00, 0x11A00),
+    (0x11A0B, 0x11A32),
+    (0x11A50, 0x11A50),
+    (0x11A5C, 0x11A83),
+    (0x11B0A, 0x11B0A),
+    (0x11DF1, 0x11DF1),
+    (0x11F04, 0x11F10),
+    (0x11F12, 0x11F33),
+)
+
+HANGUL_SBASE = 0xAC00
+HANGUL_SCOUNT = 11172
+HANGUL_TCOUNT = 28
+
+
+def _hangul_property(cp):
+    if 0x1100 <= cp <= 0x115F or 0xA960 <= cp <= 0xA97C:
+        return HANGUL_L
+    if 0x1160 <= cp <= 0x11A7 or 0xD7B0 <= cp <= 0xD7C6:
+        return HANGUL_V
+    if 0x11A8 <= cp <= 0x11FF or 0xD7CB <= cp <= 0xD7FB:
+        return HANGUL_T
+    if HANGUL_SBASE <= cp < HANGUL_SBASE + HANGUL_SCOUNT:
+        if (cp - HANGUL_SBASE) % HANGUL_TCOUNT == 0:
+            return HANGUL_LV
+        return HANGUL_LVT
+    return None
+
+
+def char_property(c):
+    """Compute the grapheme break property of the character c."""
+    cp = ord(c)
+    if c == '\r':
+        return CR
+    if c == '\n':
+        return LF
+    if c == ZERO_WIDTH_JOINER:
+        return ZWJ
+    if c in INCB_LINKERS:
+        return LINKER
+    if c == ZERO_WIDTH_NON_JOINER or c in EXTEND_CHARS:
+        return EXTEND
+    if 0x1F1E6 <= cp <= 0x1F1FF:
+        return REGIONAL_INDICATOR
+    if 0x1F3FB <= cp <= 0x1F3FF or 0xE0020 <= cp <= 0xE007F:
+        # Emoji modifiers and tags.
+        return EXTEND
+    if c in PREPEND_CHARS:
+        return PREPEND
+    if c in SPACING_MARK_LETTERS:
+        return SPACING_MARK
+    if c in OTHER_MARKS:
+        return OTHER
+    hangul = _hangul_property(cp)
+    if hangul is not None:
+        return hangul
+    category = unicodedata.category(c)
+    if category in ('Mn', 'Me'):
+        return EXTEND
+    if category == 'Mc':
+        return SPACING_MARK
+    if category in ('Cc', 'Cf', 'Zl', 'Zp', 'Cs'):
+        return CONTROL
+    for first, last in INCB_CONSONANT_RANGES:
+        if first <= cp <= last:
+            return CONSONANT
+    for first, last in PICTOGRAPHIC_RANGES:
+        if first <= cp <= last:
+            return PICTOGRAPHIC
+    return OTHER
+
+
+class _PropertyTable(dict):
+    """Lazily filled table of grapheme break properties by character."""
+
+    def __missing__(self, c):
+        prop = self[c] = char_property(c)
+        return prop
+
+
+PROPERTIES = _PropertyTable()
+
+# Properties which join the preceding character (GB9, GB9a).
+_EXTENDING = frozenset((EXTEND, ZWJ, SPACING_MARK, LINKER))
+
+# Cache marker for words which cannot be segmented on their own.
+_NEEDS_CONTEXT = ()
+
+
+def _char_class(chars):
+    return '[' + ''.join(re.escape(c) for c in sorted(chars)) + ']'
+
+
+def _cluster_regex(alphabet):
+    """
+    Build the regular expression matching one grapheme cluster for text made
+    of the characters in alphabet.
+
+    Alternatives for properties which do not occur in alphabet are left out,
+    which keeps the expression short for single script text.
+    """
+    by_prop = {}
+    for c in alphabet:
+        by_prop.setdefault(PROPERTIES[c], set()).add(c)
+
+    def chars(*props):
+        return set().union(*(by_prop.get(p, ()) for p in props))
+
+    cores = []
+    if chars(CONSONANT):
+        # Indic conjuncts (GB9c).
+        conjunct_extend = chars(EXTEND, ZWJ) - {ZERO_WIDTH_NON_JOINER}
+        core = _char_class(chars(CONSONANT))
+        if chars(LINKER):
+            core += '(?:%s*%s%s%s)*' % (
+                _char_class(conjunct_extend | chars(LINKER)),
+                _char_class(chars(LINKER)),
+                _char_class(conjunct_extend) + '*' if conjunct_extend else '',
+                _char_class(chars(CONSONANT)),
+            )
+        cores.append(core)
+    if chars(HANGUL_L, HANGUL_V, HANGUL_T, HANGUL_LV, HANGUL_LVT):
+        # Hangul syllable sequences (GB6 - GB8).
+        hangul = {
+            prop: _char_class(chars(prop)) if chars(prop) else '(?!)'
+            for prop in (HANGUL_L, HANGUL_V, HANGUL_T, HANGUL_LV, HANGUL_LVT)
+        }
+        cores.append(
+            '{L}*(?:{V}+|{LV}{V}*|{LVT}){T}*|{L}+|{T}+'.format(
+                L=hangul[HANGUL_L],
+                V=hangul[HANGUL_V],
+                T=hangul[HANGUL_T],
+                LV=hangul[HANGUL_LV],
+                LVT=hangul[HANGUL_LVT],
+            )
+        )
+    if chars(REGIONAL_INDICATOR):
+        # Flags (GB12, GB13).
+        cores.append('%s{1,2}' % _char_class(chars(REGIONAL_INDICATOR)))
+    if chars(PICTOGRAPHIC):
+        # Emoji ZWJ sequences (GB11).
+        cores.append(
+            '%s(?:%s*%s%s)*'
+            % (
+                _char_class(chars(PICTOGRAPHIC)),
+                _char_class(chars(EXTEND)) if chars(EXTEND) else '(?!)',
+                _char_class(chars(ZWJ)) if chars(ZWJ) else '(?!)',
+                _char_class(chars(PICTOGRAPHIC)),
+            )
+        )
+    controls = chars(CR, LF, CONTROL)
+    cores.append(
+        '[^%s]' % ''.join(re.escape(c) for c in sorted(controls))
+        if controls
+        else '.'
+    )
+
+    cluster = '(?:%s)' % '|'.join(cores)
+    if chars(PREPEND):
+        cluster = _char_class(chars(PREPEND)) + '*' + cluster
+    extending = chars(EXTEND, ZWJ, SPACING_MARK, LINKER)
+    if extending:
+        cluster += _char_class(extending) + '*'
+    # CR LF and controls are clusters of their own (GB3 - GB5).
+    return re.compile(r'\r\n|' + cluster + '|.', re.DOTALL)
+
+
+class Segmenter:
+    """
+    Grapheme cluster segmenter.
+
+    The regular expression is built from the property table for the
+    characters seen so far and only rebuilt when new characters appear.
+    Since a space always forms a cluster of its own unless a mark follows,
+    lines are segmented word by word, and the clusters of each word are
+    cached, which pays off for the repetitive text of training corpora.
+    If most words miss the cache, whole lines are matched instead and only
+    every SAMPLE_LINES-th line goes through the cache to notice when the
+    vocabulary starts repeating.
+    """
+
+    SAMPLE_LINES = 16
+    SAMPLE_WORDS = 4096
+
+    def __init__(self, cache_size=100000):
+        self.alphabet = frozenset()
+        self.regex = _cluster_regex(self.alphabet)
+        self.cache_size = cache_size
+        self.cache = {}
+        self.use_cache = True
+        self.lines = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _extend_alphabet(self, chars):
+        if not self.alphabet.issuperset(chars):
+            self.alphabet = self.alphabet.union(chars)
+            self.regex = _cluster_regex(self.alphabet)
+
+    def _split_word(self, word):
+        self._extend_alphabet(word)
+        if (
+            PROPERTIES[word[0]] in _EXTENDING
+            or PROPERTIES[word[-1]] == PREPEND
+        ):
+            # Joins an adjacent space, needs the context of the line.
+            clusters = _NEEDS_CONTEXT
+        else:
+            clusters = self.regex.findall(word)
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[word] = clusters
+        return clusters
+
+    def _split_line(self, s):
+        self._extend_alphabet(s)
+        return self.regex.findall(s)
+
+    def _split_cached(self, s):
+        cache = self.cache
+        clusters = []
+        first = True
+        words = s.split(' ')
+        misses = 0
+        for word in words:
+            if first:
+                first = False
+            else:
+                clusters.append(' ')
+            if not word:
+                continue
+            word_clusters = cache.get(word)
+            if word_clusters is None:
+                misses += 1
+                word_clusters = self._split_word(word)
+            if word_clusters is _NEEDS_CONTEXT:
+                clusters = self._split_line(s)
+                break
+            clusters.extend(word_clusters)
+        self.misses += misses
+        self.hits += len(words) - misses
+        if self.hits + self.misses >= self.SAMPLE_WORDS:
+            self.use_cache = self.hits >= self.misses
+            self.hits = self.misses = 0
+        return clusters
+
+    def split_word(self, word):
+        """
+        Return the grapheme clusters of word (a string without spaces), or
+        None if they depend on the adjacent spaces (like for a leading mark).
+        """
+        clusters = self.cache.get(word)
+        if clusters is None:
+            clusters = self._split_word(word)
+        if clusters is _NEEDS_CONTEXT:
+            return None
+        return clusters
+
+    def split(self, s):
+        """Return the list of extended grapheme clusters of the string s."""
+        self.lines += 1
+        if self.use_cache or self.lines % self.SAMPLE_LINES == 0:
+            return self._split_cached(s)
+        return self._split_line(s)
+
+    def segment(self, lines):
+        """Return the grapheme clusters for each string in lines."""
+        return [self.split(line) for line in lines]
+
+
+_segmenter = Segmenter()
+
+
+def split_clusters(s):
+    """Return the list of extended grapheme clusters of the string s."""
+    return _segmenter.split(s)
+
+
+def segment_lines(lines):
+    """Return the grapheme clusters for each string in lines."""
+    return _segmenter.segment(lines)
@@ -0,0 +1,247 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Helpers for line ground truth (image / `.gt.txt` pairs) as used by the Makefile.
+
+This module is imported by the box generator scripts, so it must stay cheap to
+import and must not depend on anything beyond the standard library.
+"""
+
+import concurrent.futures
+import contextlib
+import functools
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unicodedata
+
+GT_SUFFIX = '.gt.txt'
+
+# Image extensions in the order in which the Makefile pattern rules try them.
+IMAGE_EXTENSIONS = ('.png', '.bin.png', '.nrm.png', '.raw.png', '.tif')
+
+# mkstemp() creates files with mode 0600, but output files should get the
+# usual permissions.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def read_gt_line(txt):
+    """
+    Read a ground truth text file which must contain exactly one line and
+    return that line in NFC.
+    """
+    with io.open(txt, 'r', encoding='utf-8') as f:
+        lines = f.read().strip().split('\n')
+    if len(lines) != 1:
+        raise ValueError(
+            'ERROR: %s: Ground truth text file should contain exactly one line, not %s'
+            % (txt, len(lines))
+        )
+    return unicodedata.normalize('NFC', lines[0].strip())
+
+
+def find_gt_files(gt_dir):
+    """
+    Return the sorted list of all `.gt.txt` files below gt_dir (following
+    symlinks like `find -L`).
+    """
+    gt_files = []
+    for root, _, files in os.walk(gt_dir, followlinks=True):
+        gt_files.extend(
+            os.path.join(root, name)
+            for name in files
+            if name.endswith(GT_SUFFIX)
+        )
+    gt_files.sort()
+    return gt_files
+
+
+def read_gt_list(list_file):
+    """
+    Read `.gt.txt` paths (one per line) from list_file, or from stdin if
+    list_file is '-'.
+    """
+    if list_file == '-':
+        return [line.strip() for line in sys.stdin if line.strip()]
+    with io.open(list_file, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def gt_stem(txt):
+    return txt[: -len(GT_SUFFIX)] if txt.endswith(GT_SUFFIX) else txt
+
+
+def find_image(stem):
+    """Return the line image belonging to stem, or None."""
+    for ext in IMAGE_EXTENSIONS:
+        if os.path.exists(stem + ext):
+            return stem + ext
+    return None
+
+
+def is_up_to_date(path, *sources):
+    """Return True if path exists and is not older than any of the sources."""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    return all(os.stat(source).st_mtime_ns <= mtime for source in sources)
+
+
+@contextlib.contextmanager
+def open_atomic(path, mode='w', **kwargs):
+    """
+    Open a temporary file in the directory of path (with the arguments of
+    io.open) which replaces path when the with block completes, so that an
+    interrupted run never leaves a partial file that looks up to date.
+    An existing file keeps its permissions, a new one gets the default ones.
+    """
+    fd, tmp = tempfile.mkstemp(
+        prefix='.' + os.path.basename(path), dir=os.path.dirname(path) or '.'
+    )
+    try:
+        with io.open(fd, mode, **kwargs) as f:
+            yield f
+        try:
+            shutil.copymode(path, tmp)
+        except FileNotFoundError:
+            os.chmod(tmp, 0o666 & ~_UMASK)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_atomic(path, text):
+    """Write text to path atomically (see open_atomic)."""
+    with open_atomic(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(text)
+
+
+def write_if_changed(path, text):
+    """
+    Write text to path atomically unless it already has this content.
+    Returns True if path was written.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    write_atomic(path, text)
+    return True
+
+
+def _write_box_file(make_box, task):
+    image, txt, box = task
+    try:
+        write_atomic(box, make_box(image, txt))
+    except Exception as e:
+        return box, str(e)
+    return box, None
+
+
+def generate_box_files(gt_files, make_box, jobs=0, force=False):
+    """
+    Write the `.box` file for every `.gt.txt` file in gt_files using a process
+    pool with the given number of jobs (0 for all CPUs).
+
+    make_box(image, txt) must return the box file content as a string and must
+    be picklable (i.e. a module level function). Box files which are newer
+    than their image and text are skipped unless force is set.
+
+    Returns the number of failed pairs; the errors are reported on stderr.
+    """
+    tasks = []
+    errors = 0
+    for txt in gt_files:
+        stem = gt_stem(txt)
+        image = find_image(stem)
+        if image is None:
+            print('ERROR: %s: no line image found' % txt, file=sys.stderr)
+            errors += 1
+            continue
+        box = stem + '.box'
+        if force or not is_up_to_date(box, image, txt):
+            tasks.append((image, txt, box))
+
+    if not tasks:
+        return errors
+
+    jobs = jobs or os.cpu_count() or 1
+    chunksize = max(1, min(256, len(tasks) // (4 * jobs)))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        for box, error in executor.map(
+            functools.partial(_write_box_file, make_box),
+            tasks,
+            chunksize=chunksize,
+        ):
+            if error:
+                print(error, file=sys.stderr)
+                errors += 1
+    return errors
+
+
+def add_batch_arguments(arg_parser):
+    """Add the batch mode options shared by the box generator scripts."""
+    group = arg_parser.add_argument_group(
+        'batch mode',
+        'Generate the .box files for many line image text pairs in one run.',
+    )
+    group.add_argument(
+        '--gt-dir',
+        metavar='DIR',
+        help='Process all *.gt.txt files below this directory',
+    )
+    group.add_argument(
+        '--list',
+        metavar='FILE',
+        help="Process the *.gt.txt files listed in FILE ('-' for stdin)",
+    )
+    group.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=0,
+        help='Number of parallel processes (default: number of CPUs)',
+    )
+    group.add_argument(
+        '--force',
+        action='store_true',
+        help='Regenerate .box files even if they are up to date',
+    )
+
+
+def run_box_cli(arg_parser, make_box):
+    """
+    Main function of the box generator scripts: either print the box file for
+    a single pair given by --image/--txt or run the batch mode.
+    """
+    args = arg_parser.parse_args()
+    if args.gt_dir or args.list:
+        gt_files = []
+        if args.gt_dir:
+            gt_files.extend(find_gt_files(args.gt_dir))
+        if args.list:
+            gt_files.extend(read_gt_list(args.list))
+        errors = generate_box_files(
+            gt_files, make_box, jobs=args.jobs, force=args.force
+        )
+        sys.exit(1 if errors else 0)
+    if not (args.image and args.txt):
+        arg_parser.error(
+            'either --image and --txt, or --gt-dir or --list are required'
+        )
+    sys.stdout.write(make_box(args.image, args.txt))
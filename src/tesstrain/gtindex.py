@@ -0,0 +1,244 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Persistent index of the `.gt.txt` files below GROUND_TRUTH_DIR.
+
+Walking a large ground truth tree (as `find` does for ALL_FILES in the
+Makefile) is slow on network storage. The index (a SQLite database, usually
+in OUTPUT_DIR) records every directory of the tree with its modification
+time and the `.gt.txt` files in it. A refresh only stats the directories and
+lists those whose modification time changed, which is the case whenever
+entries were added, removed or renamed in them. Changes of the content of the
+files do not change the list, so the files themselves are not stat'ed.
+
+After a refresh, the sorted list of `.gt.txt` files is written next to the
+index (INDEX.list, one path per line), where the Makefile and the `--list`
+option of the Python tools read it in one go.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+from tesstrain import groundtruth
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+"""
+
+# Version of SCHEMA, an index with another version is built again.
+SCHEMA_VERSION = '2'
+
+# Directories modified less than this many nanoseconds before a refresh are
+# listed again next time, as entries added in the same clock tick would not
+# change their modification time.
+RACY_NS = 2 * 10**9
+
+
+def list_path(index):
+    """Return the path of the file list written next to index."""
+    return os.fspath(index) + '.list'
+
+
+class GtIndex:
+    """SQLite backed index of the `.gt.txt` files below gt_dir."""
+
+    def __init__(self, path, gt_dir):
+        self.path = os.fspath(path)
+        self.gt_dir = os.path.normpath(gt_dir)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+        meta = dict(self.db.execute('SELECT key, value FROM meta'))
+        if meta.get('version') != SCHEMA_VERSION:
+            self.db.executescript('DROP TABLE dirs; DROP TABLE files;' + SCHEMA)
+        if meta.get('version') != SCHEMA_VERSION or meta.get('gt_dir') != self.gt_dir:
+            # The index belongs to another ground truth directory.
+            self.db.execute('DELETE FROM dirs')
+            self.db.execute('DELETE FROM files')
+            self.db.executemany(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                (('gt_dir', self.gt_dir), ('version', SCHEMA_VERSION)),
+            )
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _scan(self, directory):
+        """List directory, replace its files and return its subdirectories."""
+        subdirs = []
+        files = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.path)
+                    elif entry.name.endswith(groundtruth.GT_SUFFIX):
+                        files.append((entry.path, directory))
+                except FileNotFoundError:
+                    # Removed while listing, or a dangling symlink.
+                    continue
+        self.db.execute('DELETE FROM files WHERE dir = ?', (directory,))
+        self.db.executemany('INSERT OR REPLACE INTO files VALUES (?, ?)', files)
+        return subdirs
+
+    def refresh(self):
+        """
+        Bring the index and its file list up to date with the tree. Returns
+        the number of directories which had to be listed again.
+        """
+        known = {}
+        children = {}
+        for path, parent, mtime_ns in self.db.execute(
+            'SELECT path, parent, mtime_ns FROM dirs'
+        ):
+            known[path] = mtime_ns
+            children.setdefault(parent, []).append(path)
+        racy_before = time.time_ns() - RACY_NS
+        seen = set()
+        scanned = 0
+        stack = [(self.gt_dir, None, ())]
+        while stack:
+            directory, parent, ancestors = stack.pop()
+            try:
+                st = os.stat(directory)
+            except FileNotFoundError:
+                continue
+            # Follow symlinks like `find -L`, but not into loops.
+            inode = (st.st_dev, st.st_ino)
+            if inode in ancestors:
+                continue
+            seen.add(directory)
+            if known.get(directory) == st.st_mtime_ns:
+                subdirs = children.get(directory, [])
+            else:
+                subdirs = self._scan(directory)
+                scanned += 1
+                mtime_ns = st.st_mtime_ns
+                if mtime_ns >= racy_before:
+                    mtime_ns = -1
+                self.db.execute(
+                    'INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)',
+                    (directory, parent, mtime_ns),
+                )
+            ancestors += (inode,)
+            stack.extend((subdir, directory, ancestors) for subdir in subdirs)
+        gone = [(path,) for path in known if path not in seen]
+        self.db.executemany('DELETE FROM dirs WHERE path = ?', gone)
+        self.db.executemany('DELETE FROM files WHERE dir = ?', gone)
+        self.db.commit()
+        if scanned or gone or not os.path.exists(list_path(self.path)):
+            write_list(self.path, self.gt_files())
+        return scanned
+
+    def gt_files(self):
+        """Return the sorted list of indexed `.gt.txt` files."""
+        return [
+            row[0] for row in self.db.execute('SELECT path FROM files ORDER BY path')
+        ]
+
+    def stats(self):
+        """Return (number of directories, number of files)."""
+        dirs = self.db.execute('SELECT COUNT(*) FROM dirs').fetchone()[0]
+        files = self.db.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+        return dirs, files
+
+
+def write_list(index, gt_files):
+    """Write the file list of index unless it already has this content."""
+    return groundtruth.write_if_changed(
+        list_path(index), ''.join(txt + '\n' for txt in gt_files)
+    )
+
+
+def read_list(index):
+    """Return the `.gt.txt` files from the file list of index."""
+    return groundtruth.read_gt_list(list_path(index))
+
+
+def refresh_index(index, gt_dir):
+    """
+    Refresh index for gt_dir, write its file list and return the sorted list
+    of `.gt.txt` files.
+    """
+    with GtIndex(index, gt_dir) as gt_index:
+        gt_index.refresh()
+    return read_list(index)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tesstrain.gtindex',
+        description='Persistent index of the *.gt.txt files below a directory.',
+    )
+    parser.add_argument(
+        '--gt-dir', required=True, metavar='DIR', help='Ground truth directory'
+    )
+    parser.add_argument(
+        '--index',
+        required=True,
+        metavar='FILE',
+        help='Path of the index database (the file list is written to FILE.list)',
+    )
+    parser.add_argument(
+        '--print',
+        action='store_true',
+        help='Print the *.gt.txt files (one per line)',
+    )
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help='Print the number of directories, files and the refresh time',
+    )
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.gt_dir):
+        print('ERROR: %s is not a directory' % args.gt_dir, file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    with GtIndex(args.index, args.gt_dir) as gt_index:
+        scanned = gt_index.refresh()
+        if args.stats:
+            dirs, files = gt_index.stats()
+            print(
+                f'{files} files in {dirs} directories, '
+                f'{scanned} listed again, {time.perf_counter() - start:.3f} s',
+                file=sys.stderr,
+            )
+    if args.print:
+        sys.stdout.writelines(txt + '\n' for txt in read_list(args.index))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Get the dimensions of line images without decoding them.
+
+PNG, TIFF and JPEG headers are parsed directly, so the box generators neither
+need to import PIL nor go through its plugin registry for the usual ground
+truth formats. Other formats fall back to PIL.
+"""
+
+import functools
+import os
+import struct
+
+# TIFF tags and field types needed to get the image dimensions.
+TIFF_IMAGE_WIDTH = 256
+TIFF_IMAGE_LENGTH = 257
+TIFF_SHORT = 3
+TIFF_LONG = 4
+
+# JPEG start of frame markers (SOF0 - SOF15 without DHT, JPG and DAC).
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _png_size(f, head):
+    # The IHDR chunk must come first, directly after the signature.
+    if len(head) >= 24 and head[12:16] == b'IHDR':
+        return struct.unpack('>II', head[16:24])
+    return None
+
+
+def _tiff_size(f, head):
+    endian = '<' if head[:2] == b'II' else '>'
+    if struct.unpack(endian + 'H', head[2:4])[0] != 42:
+        # BigTIFF or not a TIFF at all.
+        return None
+    (ifd_offset,) = struct.unpack(endian + 'I', head[4:8])
+    f.seek(ifd_offset)
+    (count,) = struct.unpack(endian + 'H', f.read(2))
+    entries = f.read(12 * count)
+    width = height = None
+    for i in range(0, len(entries) - 11, 12):
+        tag, field_type = struct.unpack(endian + 'HH', entries[i : i + 4])
+        if tag not in (TIFF_IMAGE_WIDTH, TIFF_IMAGE_LENGTH):
+            continue
+        if field_type == TIFF_SHORT:
+            (value,) = struct.unpack(endian + 'H', entries[i + 8 : i + 10])
+        elif field_type == TIFF_LONG:
+            (value,) = struct.unpack(endian + 'I', entries[i + 8 : i + 12])
+        else:
+            return None
+        if tag == TIFF_IMAGE_WIDTH:
+            width = value
+        else:
+            height = value
+    if width is None or height is None:
+        return None
+    return width, height
+
+
+def _jpeg_size(f, head):
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) != 2 or marker[0] != 0xFF:
+            return None
+        # Skip fill bytes.
+        while marker[1] == 0xFF:
+            marker = marker[1:] + f.read(1)
+            if len(marker) != 2:
+                return None
+        if 0xD0 <= marker[1] <= 0xD9 or marker[1] == 0x01:
+            # Markers without a segment.
+            continue
+        segment = f.read(2)
+        if len(segment) != 2:
+            return None
+        (length,) = struct.unpack('>H', segment)
+        if marker[1] in JPEG_SOF_MARKERS:
+            frame = f.read(5)
+            if len(frame) != 5:
+                return None
+            height, width = struct.unpack('>xHH', frame)
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _pil_size(path):
+    from PIL import Image
+
+    with Image.open(path) as im:
+        return im.size
+
+
+def probe_size(path):
+    """
+    Return (width, height) of the image at path, reading only its header if
+    it is a PNG, TIFF or JPEG file.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(32)
+        size = None
+        try:
+            if head.startswith(b'\x89PNG\r\n\x1a\n'):
+                size = _png_size(f, head)
+            elif head[:2] in (b'II', b'MM'):
+                size = _tiff_size(f, head)
+            elif head.startswith(b'\xff\xd8'):
+                size = _jpeg_size(f, head)
+        except struct.error:
+            # Truncated header, let PIL report the error.
+            size = None
+    if size is None:
+        return _pil_size(path)
+    return tuple(size)
+
+
+@functools.lru_cache(maxsize=4096)
+def _cached_size(path, mtime_ns, file_size):
+    return probe_size(path)
+
+
+def image_size(path):
+    """
+    Return (width, height) of the image at path.
+
+    Results are cached by path, modification time and file size, so repeated
+    lookups in a long running process (batch mode) cost only a stat().
+    """
+    path = os.fspath(path)
+    st = os.stat(path)
+    return _cached_size(path, st.st_mtime_ns, st.st_size)
@@ -0,0 +1,290 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Parallel, cached evaluation of the best .traineddata files with lstmeval.
+
+`evaluate` runs lstmeval for several models at once, each limited to a
+number of OpenMP threads (OMP_THREAD_LIMIT), and stores the BCER and BWER
+of each run in a SQLite cache under the content hash of the model and of
+the evaluation data (list.eval with the size and modification time of every
+.lstmf file in it). A model which was evaluated before on the same data is
+not evaluated again, so `make plot` only runs lstmeval for new checkpoints.
+
+The results are written to `lstmeval.tsv` in the format of the Makefile
+rule it replaces and to an `.eval.log` file for every model, with the line
+of lstmeval that `make evaluation` used to keep.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import os
+import re
+import subprocess
+import sys
+import time
+
+from tesstrain import groundtruth, manifest
+
+RESULTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    model TEXT NOT NULL,
+    eval_data TEXT NOT NULL,
+    log TEXT NOT NULL,
+    bcer REAL NOT NULL,
+    bwer REAL,
+    PRIMARY KEY (model, eval_data)
+);
+"""
+
+# The result line of lstmeval.
+RESULT_LINE = re.compile(
+    r'^BCER eval=([0-9.]+)(?:, BWER eval=([0-9.]+))?.*$', re.MULTILINE
+)
+
+# NAME_CER_LEARNINGITERATION_TRAININGITERATION of a checkpoint.
+CHECKPOINT_NAME = re.compile(r'_([0-9.]*)_([0-9]*)_([0-9]*)$')
+
+TSV_HEADER = (
+    'Name\tCheckpointCER\tLearningIteration\tTrainingIteration\t'
+    'EvalCER\tIterationCER\tSubtrainerCER\n'
+)
+
+
+class EvalCache(manifest.Manifest):
+    """
+    Manifest (for the cached content hashes of the models) with the lstmeval
+    results of each model and evaluation data.
+    """
+
+    def __init__(self, path, jobs=8):
+        super().__init__(path, jobs)
+        self.db.executescript(RESULTS_SCHEMA)
+
+    def result(self, model_digest, eval_digest):
+        """Return the cached (log, bcer, bwer), or None."""
+        return self.db.execute(
+            'SELECT log, bcer, bwer FROM results WHERE model = ? AND eval_data = ?',
+            (model_digest, eval_digest),
+        ).fetchone()
+
+    def add_result(self, model_digest, eval_digest, log, bcer, bwer):
+        self.db.execute(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+            (model_digest, eval_digest, log, bcer, bwer),
+        )
+        self.db.commit()
+
+
+def eval_data_digest(eval_list):
+    """
+    Return the hash of eval_list and of the size and modification time of
+    every file listed in it.
+    """
+    h = hashlib.sha256()
+    with open(eval_list, 'rb') as f:
+        for line in f:
+            h.update(line)
+            path = line.strip().decode('utf-8')
+            if path:
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    h.update(b'\0missing\n')
+                else:
+                    h.update(b'\0%d %d\n' % (st.st_size, st.st_mtime_ns))
+    return h.hexdigest()
+
+
+def run_lstmeval(model, eval_list, threads=1, lstmeval='lstmeval'):
+    """
+    Run lstmeval for model on eval_list with at most threads OpenMP threads.
+    Returns (log, bcer, bwer) where log is the result line of lstmeval.
+    """
+    env = dict(os.environ, OMP_THREAD_LIMIT=str(threads))
+    proc = subprocess.run(
+        [
+            lstmeval,
+            '--verbosity=0',
+            '--model',
+            model,
+            '--eval_listfile',
+            eval_list,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        env=env,
+    )
+    output = proc.stdout.decode('utf-8', errors='replace')
+    match = RESULT_LINE.search(output)
+    if proc.returncode != 0 or match is None:
+        raise RuntimeError(
+            '%s failed for %s with return code %d: %s'
+            % (lstmeval, model, proc.returncode, output.strip()[-1000:])
+        )
+    bwer = float(match.group(2)) if match.group(2) else None
+    return match.group(0), float(match.group(1)), bwer
+
+
+def evaluate(
+    models,
+    eval_list,
+    cache_path,
+    jobs=0,
+    threads=1,
+    lstmeval='lstmeval',
+):
+    """
+    Evaluate models (paths of .traineddata files) on eval_list with up to
+    jobs (0: number of CPUs / threads) runs of lstmeval at once, using and
+    filling the cache at cache_path.
+
+    Returns a dict with the (log, bcer, bwer) of every model and a dict with
+    the errors of the models which failed.
+    """
+    jobs = jobs or max(1, (os.cpu_count() or 1) // threads)
+    eval_digest = eval_data_digest(eval_list)
+    results = {}
+    errors = {}
+    with EvalCache(cache_path) as cache:
+        digests = cache.digests(models)
+        cache.db.commit()
+        pending = []
+        for model in models:
+            result = cache.result(digests[model], eval_digest)
+            if result is None:
+                pending.append(model)
+            else:
+                results[model] = result
+        print(
+            f'{len(results)} of {len(models)} models evaluated before, '
+            f'running lstmeval for {len(pending)} with {jobs} jobs',
+            file=sys.stderr,
+        )
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(
+                    _timed, run_lstmeval, model, eval_list, threads, lstmeval
+                ): model
+                for model in pending
+            }
+            for future in concurrent.futures.as_completed(futures):
+                model = futures[future]
+                try:
+                    seconds, result = future.result()
+                except Exception as e:
+                    errors[model] = e
+                    continue
+                print(f'{model}: {result[0]} ({seconds:.1f} s)', file=sys.stderr)
+                cache.add_result(digests[model], eval_digest, *result)
+                results[model] = result
+    return results, errors
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def tsv_rows(results):
+    """
+    Return the lines of lstmeval.tsv for results (as returned by evaluate)
+    in the order of the former Makefile rule.
+    """
+    rows = []
+    for model in sorted(results, reverse=True):
+        name = os.path.basename(model)
+        if name.endswith('.traineddata'):
+            name = name[: -len('.traineddata')]
+        match = CHECKPOINT_NAME.search(name)
+        if match is None:
+            continue
+        checkpoint_cer, learning, training = match.groups()
+        eval_cer = RESULT_LINE.match(results[model][0]).group(1)
+        rows.append(
+            f'\t{checkpoint_cer}\t{learning}\t{training}\t{eval_cer}\t\t\n'
+        )
+    return rows
+
+
+def write_logs(results, log_dir):
+    """Write the .eval.log file of each model in results to log_dir."""
+    for model, (log, _, _) in results.items():
+        name = os.path.basename(model)
+        if name.endswith('.traineddata'):
+            name = name[: -len('.traineddata')]
+        groundtruth.write_if_changed(
+            os.path.join(log_dir, name + '.eval.log'), log + '\n'
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tesstrain.lstmeval',
+        description='Evaluate .traineddata files with lstmeval in parallel, '
+        'with cached results, and write lstmeval.tsv.',
+    )
+    parser.add_argument('models', nargs='*', help='.traineddata files')
+    parser.add_argument(
+        '--eval-list', required=True, metavar='FILE', help='list.eval file'
+    )
+    parser.add_argument(
+        '--cache',
+        required=True,
+        metavar='FILE',
+        help='SQLite database with the cached results',
+    )
+    parser.add_argument('--output', help='Path of lstmeval.tsv to write')
+    parser.add_argument(
+        '--log-dir', metavar='DIR', help='Write NAME.eval.log files to DIR'
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=0,
+        help='Number of parallel lstmeval runs (default: number of CPUs / threads)',
+    )
+    parser.add_argument(
+        '--threads',
+        type=int,
+        default=1,
+        help='OpenMP threads of each lstmeval run (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--lstmeval', default='lstmeval', help='lstmeval executable'
+    )
+    args = parser.parse_args(argv)
+
+    os.makedirs(os.path.dirname(args.cache) or '.', exist_ok=True)
+    results, errors = evaluate(
+        args.models,
+        args.eval_list,
+        args.cache,
+        jobs=args.jobs,
+        threads=max(1, args.threads),
+        lstmeval=args.lstmeval,
+    )
+    for model, error in sorted(errors.items()):
+        print('ERROR: %s: %s' % (model, error), file=sys.stderr)
+    if args.log_dir:
+        os.makedirs(args.log_dir, exist_ok=True)
+        write_logs(results, args.log_dir)
+    if args.output:
+        groundtruth.write_if_changed(
+            args.output, TSV_HEADER + ''.join(tsv_rows(results))
+        )
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
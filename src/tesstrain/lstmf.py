@@ -0,0 +1,663 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Build the `.box` and `.lstmf` files for line ground truth and the `all-lstmf`
+list without Make.
+
+With hundreds of thousands of lines, Make spends a long time on the huge
+prerequisite lists of `all-lstmf` before doing any work. This module finds
+the pairs itself, schedules a `.box` task and a dependent `.lstmf` task for
+each outdated pair (with the same up-to-date rules and file layout as the
+Makefile) on a bounded pool, retries transient failures and writes the
+shuffled `all-lstmf` list.
+
+Every run of tesseract loads its model and configuration, which costs much
+more than extracting the features of one line. With --shard-size N, tesseract
+gets a list of N line images per run instead and writes one multi-line
+`.lstmf` shard for them (the list is kept next to the shard as `.list`).
+`all-lstmf` then lists the shards, so `list.train` and `list.eval` are split
+by shard. Since tesseract rewrites the shard after each line, shards of a few
+hundred lines work best. --benchmark compares the lines per second of both
+modes.
+
+With --cache DIR, the .lstmf files and shards are taken from a cache shared
+with other OUTPUT_DIRs when their inputs have been processed before (see
+tesstrain.lstmfcache), and new ones are added to it.
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import errno
+import heapq
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from tesstrain import boxes, groundtruth, lstmfcache, manifest, shuffle, sizes, tessapi
+
+# Errors of starting a process or of file I/O which may go away when trying
+# again later.
+TRANSIENT_ERRNOS = frozenset(
+    (errno.EAGAIN, errno.EINTR, errno.EBUSY, errno.ENOMEM, errno.EMFILE, errno.ENFILE)
+)
+
+# Files which `tesseract BASE lstm.train` may write next to BASE.lstmf.
+TESSERACT_OUTPUTS = ('.lstmf', '.tr', '.txt')
+
+# A line of a box file: symbol, left, bottom, right, top, page and the text of
+# a WordStr box.
+BOX_LINE = re.compile(r'(.*?) (-?\d+ -?\d+ -?\d+ -?\d+) \d+( #.*)?$', re.DOTALL)
+
+
+class TransientError(Exception):
+    """A task failed for a reason which may go away when it is run again."""
+
+
+def run_tasks(tasks, jobs=0, retries=2, backoff=1.0):
+    """
+    Run a graph of tasks with up to jobs (0 for the number of CPUs) at once.
+
+    tasks maps a task name to (func, args, deps) where deps are the names of
+    the tasks which must have succeeded before func(*args) may run. Tasks
+    run on a thread pool, except for those with a function in PROCESS_TASKS,
+    which run on a process pool. Tasks which raise TransientError are run
+    again up to retries times, after backoff seconds, doubled on every retry.
+
+    Returns a dict with the error of each failed task; tasks whose
+    dependencies failed are not run and are left out.
+    """
+    waiting = {name: set(deps) for name, (_, _, deps) in tasks.items()}
+    dependents = {name: [] for name in tasks}
+    for name, deps in waiting.items():
+        for dep in deps:
+            dependents[dep].append(name)
+    ready = collections.deque(name for name, deps in waiting.items() if not deps)
+    # Heap of (time, name) of the tasks which are run again after a backoff.
+    retrying = []
+    attempts = dict.fromkeys(tasks, 0)
+    errors = {}
+
+    jobs = jobs or os.cpu_count() or 1
+    threads = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    processes = None
+    try:
+        running = {}
+        while ready or retrying or running:
+            now = time.monotonic()
+            while retrying and retrying[0][0] <= now:
+                ready.append(heapq.heappop(retrying)[1])
+            while ready and len(running) < jobs:
+                name = ready.popleft()
+                func, args, _ = tasks[name]
+                if func in PROCESS_TASKS:
+                    if processes is None:
+                        processes = concurrent.futures.ProcessPoolExecutor(
+                            max_workers=jobs
+                        )
+                    executor = processes
+                else:
+                    executor = threads
+                attempts[name] += 1
+                running[executor.submit(func, *args)] = name
+            timeout = max(0, retrying[0][0] - now) if retrying else None
+            if not running:
+                time.sleep(timeout)
+                continue
+            done, _ = concurrent.futures.wait(
+                running, timeout, concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                except TransientError as e:
+                    if attempts[name] <= retries:
+                        print(
+                            'WARNING: %s: %s, trying again' % (name, e),
+                            file=sys.stderr,
+                        )
+                        delay = backoff * 2 ** (attempts[name] - 1)
+                        heapq.heappush(retrying, (time.monotonic() + delay, name))
+                    else:
+                        errors[name] = e
+                except Exception as e:
+                    errors[name] = e
+                else:
+                    for dependent in dependents[name]:
+                        waiting[dependent].discard(name)
+                        if not waiting[dependent]:
+                            ready.append(dependent)
+    finally:
+        threads.shutdown()
+        if processes is not None:
+            processes.shutdown()
+    return errors
+
+
+def make_box_file(box_script, image, txt, box):
+    """Write box for image and txt with the make_box function of box_script."""
+    try:
+        groundtruth.write_atomic(box, boxes.load_make_box(box_script)(image, txt))
+    except OSError as e:
+        if e.errno in TRANSIENT_ERRNOS:
+            raise TransientError(str(e)) from e
+        raise
+
+
+# Task functions of run_tasks() which run Python code, and so would hold the
+# GIL on a thread, and only take picklable arguments.
+PROCESS_TASKS = frozenset((make_box_file,))
+
+
+def _temp_base(lstmf):
+    return '%s.%d-%d.tmp' % (
+        lstmf[: -len('.lstmf')],
+        os.getpid(),
+        threading.get_ident(),
+    )
+
+
+def _remove_temp_files(base, suffixes=TESSERACT_OUTPUTS):
+    for suffix in suffixes:
+        if os.path.exists(base + suffix):
+            os.unlink(base + suffix)
+
+
+def _run_tesseract(image, base, psm, tesseract, api=None):
+    if api is not None:
+        try:
+            api.process(image, base)
+        except tessapi.TessApiError as e:
+            print('WARNING: %s, running %s' % (e, tesseract), file=sys.stderr)
+        else:
+            if os.path.exists(base + '.lstmf'):
+                return
+    try:
+        proc = subprocess.run(
+            [tesseract, image, base, '--psm', str(psm), 'lstm.train'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+        )
+    except OSError as e:
+        if e.errno in TRANSIENT_ERRNOS:
+            raise TransientError(str(e)) from e
+        raise
+    output = proc.stdout.decode('utf-8', errors='replace').strip()
+    if proc.returncode < 0:
+        # Killed by a signal (e.g. by the OOM killer).
+        raise TransientError(
+            '%s killed by signal %d' % (tesseract, -proc.returncode)
+        )
+    if proc.returncode != 0 or not os.path.exists(base + '.lstmf'):
+        raise RuntimeError(
+            '%s failed with return code %d: %s'
+            % (tesseract, proc.returncode, output)
+        )
+
+
+def _store(cache, key, lstmf):
+    try:
+        cache.store(key, lstmf)
+    except OSError as e:
+        print('WARNING: could not cache %s: %s' % (lstmf, e), file=sys.stderr)
+
+
+def make_lstmf_file(
+    image,
+    lstmf,
+    psm=13,
+    tesseract='tesseract',
+    api=None,
+    cache=None,
+    version='unknown',
+):
+    """
+    Run `tesseract IMAGE BASE --psm PSM lstm.train` like the Makefile does,
+    but with a temporary output base, so that an interrupted run does not
+    leave a partial .lstmf file which looks up to date.
+
+    With api (a tessapi.ApiPool initialized for lstm.train and psm), the
+    image is processed in-process, and tesseract only runs if that fails.
+    With cache (a lstmfcache.LstmfCache), the .lstmf file is taken from the
+    cache if it has one for the image and box with psm and the tesseract
+    version, and is added to it otherwise.
+    """
+    box = lstmf[: -len('.lstmf')] + '.box'
+    if cache is not None:
+        key = lstmfcache.lstmf_key([image], [box], psm, version)
+        if cache.fetch(key, lstmf, image, box):
+            return
+    tmp = _temp_base(lstmf)
+    try:
+        _run_tesseract(image, tmp, psm, tesseract, api)
+        if cache is not None:
+            _store(cache, key, tmp + '.lstmf')
+        os.replace(tmp + '.lstmf', lstmf)
+    finally:
+        _remove_temp_files(tmp)
+
+
+def paged_box(box_text, page):
+    """Return box_text with the page number of all boxes set to page."""
+    lines = []
+    for line in box_text.splitlines():
+        match = BOX_LINE.match(line)
+        if match is None:
+            raise ValueError('invalid box line %r' % line)
+        symbol, coordinates, text = match.groups()
+        lines.append('%s %s %d%s\n' % (symbol, coordinates, page, text or ''))
+    return ''.join(lines)
+
+
+def make_shard_file(
+    images,
+    boxes,
+    shard,
+    psm=13,
+    tesseract='tesseract',
+    api=None,
+    cache=None,
+    version='unknown',
+):
+    """
+    Write the lines of all images with their boxes into shard with a single
+    run of tesseract.
+
+    tesseract only appends to an .lstmf file for the pages of a multi-page
+    image (like those rendered by text2image), so the line images are
+    combined into a temporary multi-page TIFF with a box file whose pages
+    are the lines. The list of images is written next to the shard.
+    cache and version are used like in make_lstmf_file.
+    """
+    if cache is not None:
+        key = lstmfcache.lstmf_key(images, boxes, psm, version)
+        if cache.fetch(key, shard, *images, *boxes):
+            groundtruth.write_atomic(
+                shard_list(shard), ''.join(i + '\n' for i in images)
+            )
+            return
+    from PIL import Image
+
+    tmp = _temp_base(shard)
+    try:
+        frames = []
+        box_text = []
+        for page, (image, box) in enumerate(zip(images, boxes)):
+            with Image.open(image) as frame:
+                frame.load()
+                frames.append(frame)
+            with open(box, 'r', encoding='utf-8') as f:
+                box_text.append(paged_box(f.read(), page))
+        frames[0].save(
+            tmp + '.tif', save_all=True, append_images=frames[1:]
+        )
+        del frames
+        groundtruth.write_atomic(tmp + '.box', ''.join(box_text))
+        _run_tesseract(tmp + '.tif', tmp, psm, tesseract, api)
+        if cache is not None:
+            _store(cache, key, tmp + '.lstmf')
+        os.replace(tmp + '.lstmf', shard)
+    finally:
+        _remove_temp_files(tmp, ('.tif', '.box') + TESSERACT_OUTPUTS)
+    groundtruth.write_atomic(shard_list(shard), ''.join(i + '\n' for i in images))
+
+
+def shard_list(shard):
+    """Return the path of the list of line images of shard."""
+    return shard[: -len('.lstmf')] + '.list'
+
+
+def _shard_is_current(shard, images, boxes):
+    try:
+        with open(shard_list(shard), 'r', encoding='utf-8') as f:
+            if f.read().splitlines() != images:
+                return False
+    except FileNotFoundError:
+        return False
+    return groundtruth.is_up_to_date(shard, *images, *boxes)
+
+
+def lstmf_tasks(
+    gt_files,
+    box_script,
+    psm=13,
+    tesseract='tesseract',
+    shard_size=0,
+    shard_dir=None,
+    api=None,
+    cache=None,
+    version='unknown',
+):
+    """
+    Return (tasks, lstmf_files) for the pairs of gt_files: the tasks for
+    run_tasks() which bring the .box and .lstmf files up to date, and the list
+    of all .lstmf files in the order of gt_files.
+
+    With a shard_size, the lines are put into shards of shard_size lines
+    (in the order of gt_files) in shard_dir instead of one .lstmf file per
+    line, and lstmf_files lists the shards. api, cache and version are
+    passed on to make_lstmf_file and make_shard_file.
+    """
+    tasks = {}
+    lstmf_files = []
+    pairs = []
+    for txt in gt_files:
+        stem = groundtruth.gt_stem(txt)
+        image = groundtruth.find_image(stem)
+        if image is None:
+            tasks[txt] = (_missing_image, (txt,), ())
+            continue
+        box = stem + '.box'
+        deps = ()
+        if not groundtruth.is_up_to_date(box, image, txt):
+            tasks[box] = (make_box_file, (box_script, image, txt, box), ())
+            deps = (box,)
+        pairs.append((image, box, deps))
+    if shard_size:
+        for number, start in enumerate(range(0, len(pairs), shard_size), 1):
+            chunk = pairs[start : start + shard_size]
+            images = [image for image, _, _ in chunk]
+            boxes = [box for _, box, _ in chunk]
+            deps = tuple(dep for _, _, box_deps in chunk for dep in box_deps)
+            shard = os.path.join(shard_dir, 'shard-%06d.lstmf' % number)
+            lstmf_files.append(shard)
+            if deps or not _shard_is_current(shard, images, boxes):
+                tasks[shard] = (
+                    make_shard_file,
+                    (images, boxes, shard, psm, tesseract, api, cache, version),
+                    deps,
+                )
+        return tasks, lstmf_files
+    for image, box, deps in pairs:
+        lstmf = box[: -len('.box')] + '.lstmf'
+        lstmf_files.append(lstmf)
+        if deps or not groundtruth.is_up_to_date(lstmf, image, box):
+            tasks[lstmf] = (
+                make_lstmf_file,
+                (image, lstmf, psm, tesseract, api, cache, version),
+                deps,
+            )
+    return tasks, lstmf_files
+
+
+def _missing_image(txt):
+    raise FileNotFoundError('no line image found for %s' % txt)
+
+
+def shuffled(lines, seed):
+    """Sort and shuffle lines like shuffle.py with the same seed."""
+    return shuffle.shuffle_lines(lines, str(seed))
+
+
+def benchmark(
+    images, boxes, shard_size, psm=13, tesseract='tesseract', jobs=0, api=None
+):
+    """
+    Extract the features of the line images with their boxes into a
+    temporary directory, once with one tesseract run per line and once in
+    shards of shard_size lines. Returns the lines per second of both.
+    """
+    rates = []
+    with tempfile.TemporaryDirectory(prefix='lstmf-benchmark-') as tmp:
+        for size in (1, shard_size):
+            tasks = {}
+            for start in range(0, len(images), size):
+                lstmf = os.path.join(tmp, '%d-%06d.lstmf' % (size, start))
+                if size == 1:
+                    task = (
+                        make_lstmf_file,
+                        (images[start], lstmf, psm, tesseract, api),
+                        (),
+                    )
+                else:
+                    task = (
+                        make_shard_file,
+                        (
+                            images[start : start + size],
+                            boxes[start : start + size],
+                            lstmf,
+                            psm,
+                            tesseract,
+                            api,
+                        ),
+                        (),
+                    )
+                tasks[lstmf] = task
+            start = time.perf_counter()
+            errors = run_tasks(tasks, jobs=jobs, retries=0)
+            if errors:
+                name, error = sorted(errors.items())[0]
+                raise RuntimeError('%s: %s' % (name, error))
+            rates.append(len(images) / (time.perf_counter() - start))
+    return tuple(rates)
+
+
+def run_benchmark(args, gt_files, api):
+    # The .box files are brought up to date first and are not part of the
+    # measurement.
+    tasks, _ = lstmf_tasks(gt_files, args.box_script)
+    box_tasks = {
+        name: task for name, task in tasks.items() if task[0] is not make_lstmf_file
+    }
+    errors = run_tasks(box_tasks, jobs=args.jobs, retries=args.retries)
+    for name, error in sorted(errors.items()):
+        print('ERROR: %s: %s' % (name, error), file=sys.stderr)
+    if errors:
+        return 1
+    images = []
+    boxes = []
+    for txt in gt_files:
+        stem = groundtruth.gt_stem(txt)
+        images.append(groundtruth.find_image(stem))
+        boxes.append(stem + '.box')
+    shard_size = args.shard_size or 100
+    line_rate, shard_rate = benchmark(
+        images,
+        boxes,
+        shard_size,
+        psm=args.psm,
+        tesseract=args.tesseract,
+        jobs=args.jobs,
+        api=api,
+    )
+    print(
+        f'{len(images)} lines: {line_rate:.1f} lines/s with one run per line, '
+        f'{shard_rate:.1f} lines/s with shards of {shard_size} lines '
+        f'({shard_rate / line_rate:.1f}x)'
+    )
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tesstrain.lstmf',
+        description='Build the .box and .lstmf files and the all-lstmf list.',
+    )
+    parser.add_argument(
+        '--gt-dir', metavar='DIR', help='Use all *.gt.txt files below DIR'
+    )
+    parser.add_argument(
+        '--list',
+        metavar='FILE',
+        help="Use the *.gt.txt files listed in FILE ('-' for stdin)",
+    )
+    parser.add_argument(
+        '--exclude',
+        metavar='FILE',
+        help='Leave out the *.gt.txt files listed in FILE (e.g. a quarantine list)',
+    )
+    parser.add_argument('--output', help='Path of the all-lstmf list to write')
+    parser.add_argument(
+        '--box-script',
+        default='generate_line_box.py',
+        help='Box generator script (default: %(default)s)',
+    )
+    parser.add_argument(
+        '--psm', default='13', help='Page segmentation mode (default: 13)'
+    )
+    parser.add_argument(
+        '--tesseract', default='tesseract', help='tesseract executable'
+    )
+    parser.add_argument(
+        '--random-seed',
+        default='0',
+        help='Seed for shuffling the list like shuffle.py (default: 0)',
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=0,
+        help='Number of parallel jobs (default: number of CPUs)',
+    )
+    parser.add_argument(
+        '--backend',
+        choices=['subprocess', 'api'],
+        default='subprocess',
+        help='subprocess: run the tesseract program for every image; '
+        'api (experimental): process the images in-process with libtesseract, '
+        'falling back to the program if it is not available '
+        '(default: %(default)s)',
+    )
+    parser.add_argument(
+        '--shard-size',
+        type=int,
+        default=0,
+        help='Write shards of this many lines instead of one .lstmf per line',
+    )
+    parser.add_argument(
+        '--shard-dir',
+        metavar='DIR',
+        help='Directory for the shards (default: directory of --output)',
+    )
+    parser.add_argument(
+        '--benchmark',
+        type=int,
+        metavar='N',
+        help='Compare the lines per second of one tesseract run per line and '
+        'of shards (of --shard-size lines, default 100) for the first N lines, '
+        'without writing any .lstmf files or --output',
+    )
+    parser.add_argument(
+        '--cache',
+        metavar='DIR',
+        help='Shared cache of .lstmf files, keyed by the content of their inputs',
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=sizes.parse_size,
+        default=0,
+        metavar='SIZE',
+        help='Evict the least recently used files beyond this size '
+        '(e.g. 20G, default: no limit)',
+    )
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=2,
+        help='Retries of tasks with transient failures (default: 2)',
+    )
+    args = parser.parse_args(argv)
+    if not (args.gt_dir or args.list):
+        parser.error('--gt-dir or --list is required')
+    if not (args.output or args.benchmark):
+        parser.error('--output is required')
+
+    gt_files = []
+    if args.gt_dir:
+        gt_files.extend(groundtruth.find_gt_files(args.gt_dir))
+    if args.list:
+        gt_files.extend(groundtruth.read_gt_list(args.list))
+    if args.exclude:
+        excluded = set(groundtruth.read_gt_list(args.exclude))
+        gt_files = [txt for txt in gt_files if txt not in excluded]
+    if not gt_files:
+        print('ERROR: found no *.gt.txt files', file=sys.stderr)
+        return 1
+
+    api = None
+    if args.backend == 'api':
+        api = tessapi.ApiPool.create(configs=['lstm.train'], psm=args.psm)
+        if api is None:
+            print(
+                'WARNING: libtesseract not found, running %s' % args.tesseract,
+                file=sys.stderr,
+            )
+        else:
+            print(
+                'WARNING: the api backend is experimental, check its .lstmf '
+                'files against the ones of the subprocess backend',
+                file=sys.stderr,
+            )
+    cache = None
+    if args.cache and not args.benchmark:
+        cache = lstmfcache.LstmfCache(args.cache, args.cache_size)
+    try:
+        if args.benchmark:
+            return run_benchmark(args, gt_files[: args.benchmark], api)
+        return build(args, gt_files, api, cache)
+    finally:
+        if api is not None:
+            api.close()
+        if cache is not None:
+            cache.close()
+
+
+def build(args, gt_files, api, cache=None):
+    shard_dir = args.shard_dir or os.path.join(
+        os.path.dirname(args.output), 'lstmf-shards'
+    )
+    if args.shard_size:
+        os.makedirs(shard_dir, exist_ok=True)
+    version = 'unknown'
+    if cache is not None:
+        # The key of a cached file includes the version which produces it.
+        if api is not None:
+            version = 'tesseract %s' % tessapi.version()
+        else:
+            version = manifest.tesseract_version(args.tesseract)
+    tasks, lstmf_files = lstmf_tasks(
+        gt_files,
+        args.box_script,
+        psm=args.psm,
+        tesseract=args.tesseract,
+        shard_size=args.shard_size,
+        shard_dir=shard_dir,
+        api=api,
+        cache=cache,
+        version=version,
+    )
+    start = time.perf_counter()
+    errors = run_tasks(tasks, jobs=args.jobs, retries=args.retries)
+    for name, error in sorted(errors.items()):
+        print('ERROR: %s: %s' % (name, error), file=sys.stderr)
+    print(
+        f'{len(tasks)} tasks for {len(gt_files)} lines in '
+        f'{time.perf_counter() - start:.1f} s, {len(errors)} failed'
+    )
+    if cache is not None:
+        print('%s: %s' % (args.cache, lstmfcache.format_stats(cache.stats())))
+    if errors:
+        return 1
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    lines = shuffled([lstmf + '\n' for lstmf in lstmf_files], args.random_seed)
+    groundtruth.write_if_changed(args.output, ''.join(lines))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Content addressed cache of `.lstmf` files shared by several OUTPUT_DIRs.
+
+Models trained on overlapping ground truth (fine-tunes of different
+START_MODELs, other nets, ...) need the same `.lstmf` files. The cache stores
+each of them once under a key computed from the content of the line image
+and its `.box` file, the page segmentation mode and the tesseract version
+(see manifest.combine_key), and puts it in place as a hard link (or a
+reflink or copy on another file system).
+
+The cache directory holds the objects (`objects/ab/KEY.lstmf`) and a SQLite
+database with their sizes and last use, which is used to evict the least
+recently used objects when the cache grows beyond its maximum size, and with
+counters for `stats`. Evicting an object does not affect the files linked
+from it.
+
+A hard link shares its modification time with the object, so a fetched file
+gets the modification time of the newest of its inputs if it is older.
+Linked files must never be modified in place, they are replaced instead.
+The image name stored in a cached file is that of the image it was first
+made for, which tesseract only uses for debug output.
+"""
+
+import argparse
+import errno
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+from tesstrain.manifest import combine_key, file_digest
+from tesstrain.sizes import parse_size
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_last_used ON objects (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+COUNTERS = ('hits', 'misses', 'stored', 'evicted', 'bytes_saved')
+
+# Eviction removes objects until the cache is this fraction of its maximum
+# size, so that it does not run again after every new object.
+EVICT_TO = 0.9
+
+# ioctl request of Linux to clone the extents of a file (a reflink).
+FICLONE = 0x40049409
+
+# Errors of os.link() which mean that the file has to be cloned or copied.
+LINK_ERRNOS = frozenset((errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP))
+
+
+def lstmf_key(images, boxes, psm, version):
+    """
+    Return the cache key of the .lstmf file (or shard) for the line images
+    with their box files.
+    """
+    digests = []
+    for image, box in zip(images, boxes):
+        digests.extend((file_digest(image), file_digest(box)))
+    return combine_key('lstmf', str(psm), version, *digests)
+
+
+def _clone(src, dest):
+    """Copy src to dest, as a reflink if the file system supports it."""
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    if fcntl is not None and sys.platform.startswith('linux'):
+        with open(src, 'rb') as fsrc, open(dest, 'wb') as fdest:
+            try:
+                fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+                return 'reflink'
+            except OSError:
+                pass
+    shutil.copyfile(src, dest)
+    return 'copy'
+
+
+def place(src, dest, link=True):
+    """
+    Put src at dest (replacing it atomically) as a hard link, or as a reflink
+    or copy if src cannot be linked there (or link is false). Returns how it
+    was placed.
+    """
+    tmp = '%s.%d-%d.tmp' % (dest, os.getpid(), threading.get_ident())
+    how = None
+    if link:
+        try:
+            os.link(src, tmp)
+            how = 'link'
+        except OSError as e:
+            if e.errno not in LINK_ERRNOS:
+                raise
+    if how is None:
+        how = _clone(src, tmp)
+    try:
+        os.replace(tmp, dest)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return how
+
+
+class LstmfCache:
+    """
+    Cache of .lstmf files in cache_dir, evicting the least recently used
+    ones beyond max_size bytes (0 for no limit). Can be used by several
+    threads and processes at once.
+    """
+
+    def __init__(self, cache_dir, max_size=0):
+        self.cache_dir = os.fspath(cache_dir)
+        self.max_size = max_size
+        os.makedirs(os.path.join(self.cache_dir, 'objects'), exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            os.path.join(self.cache_dir, 'cache.sqlite'),
+            timeout=60,
+            check_same_thread=False,
+        )
+        with self.lock, self.db:
+            self.db.executescript(SCHEMA)
+            self.db.executemany(
+                'INSERT OR IGNORE INTO counters VALUES (?, 0)',
+                ((name,) for name in COUNTERS),
+            )
+            # The total size of the objects, kept up to date by store() and
+            # evict(), so that they do not have to sum up all objects.
+            self.db.execute(
+                "INSERT OR IGNORE INTO counters "
+                "SELECT 'size', CAST(TOTAL(size) AS INTEGER) FROM objects"
+            )
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def object_path(self, key):
+        return os.path.join(self.cache_dir, 'objects', key[:2], key + '.lstmf')
+
+    def _count(self, **counts):
+        self.db.executemany(
+            'UPDATE counters SET value = value + ? WHERE name = ?',
+            ((value, name) for name, value in counts.items()),
+        )
+
+    def fetch(self, key, dest, *sources):
+        """
+        Put the cached object of key at dest and return True, or return
+        False if it is not in the cache. dest gets at least the modification
+        time of the newest of sources.
+        """
+        path = self.object_path(key)
+        newest = max([os.stat(source).st_mtime_ns for source in sources] or [0])
+        try:
+            # A hard link shares the modification time with the object and
+            # all other links to it, so an object which is older than the
+            # sources is copied instead.
+            older = os.stat(path).st_mtime_ns < newest
+            how = place(path, dest, link=not older)
+        except FileNotFoundError:
+            with self.lock, self.db:
+                self._count(misses=1)
+            return False
+        st = os.stat(dest)
+        if older:
+            os.utime(dest, ns=(st.st_atime_ns, newest))
+        with self.lock, self.db:
+            # The object may have been evicted by another process meanwhile,
+            # which leaves dest as it is.
+            self.db.execute(
+                'UPDATE objects SET last_used = ? WHERE key = ?',
+                (time.time(), key),
+            )
+            self._count(
+                hits=1, bytes_saved=st.st_size if how != 'copy' else 0
+            )
+        return True
+
+    def store(self, key, src):
+        """Add the file src as the object of key."""
+        path = self.object_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        place(src, path)
+        size = os.path.getsize(path)
+        with self.lock, self.db:
+            # Replaces the object of key if another process stored it, too.
+            self.db.execute(
+                "UPDATE counters SET value = value - COALESCE("
+                "(SELECT size FROM objects WHERE key = ?), 0) WHERE name = 'size'",
+                (key,),
+            )
+            self.db.execute(
+                'INSERT OR REPLACE INTO objects VALUES (?, ?, ?)',
+                (key, size, time.time()),
+            )
+            self._count(stored=1, size=size)
+        if self.max_size and self.size() > self.max_size:
+            self.evict(int(self.max_size * EVICT_TO))
+
+    def size(self):
+        """Return the total size of the cached objects."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT value FROM counters WHERE name = 'size'"
+            ).fetchone()[0]
+
+    def evict(self, max_size):
+        """
+        Remove the least recently used objects until the cache is not larger
+        than max_size. Returns the number of removed objects.
+        """
+        keys = []
+        freed = 0
+        with self.lock, self.db:
+            # Take the write lock first, so that no other process evicts the
+            # same objects.
+            self._count(evicted=0)
+            total = self.db.execute(
+                "SELECT value FROM counters WHERE name = 'size'"
+            ).fetchone()[0]
+            rows = self.db.execute(
+                'SELECT key, size FROM objects ORDER BY last_used'
+            )
+            for key, size in rows:
+                if total - freed <= max_size:
+                    break
+                try:
+                    os.unlink(self.object_path(key))
+                except FileNotFoundError:
+                    pass
+                keys.append((key,))
+                freed += size
+            self.db.executemany('DELETE FROM objects WHERE key = ?', keys)
+            self._count(evicted=len(keys), size=-freed)
+        return len(keys)
+
+    def stats(self):
+        """Return a dict with the counters, the number and size of objects."""
+        with self.lock:
+            stats = dict(self.db.execute('SELECT name, value FROM counters'))
+            stats['objects'] = self.db.execute(
+                'SELECT COUNT(*) FROM objects'
+            ).fetchone()[0]
+        return stats
+
+
+def format_stats(stats):
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = 100 * stats['hits'] / lookups if lookups else 0
+    return (
+        f"{stats['objects']} objects ({stats['size']} bytes), "
+        f"{stats['hits']} hits and {stats['misses']} misses "
+        f'({hit_rate:.1f}% hit rate), '
+        f"{stats['bytes_saved']} bytes saved by links, "
+        f"{stats['stored']} stored, {stats['evicted']} evicted"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tesstrain.lstmfcache',
+        description='Shared content addressed cache of .lstmf files.',
+    )
+    parser.add_argument(
+        'command',
+        choices=['stats', 'evict'],
+        help='stats: print the hit rate and the bytes saved; '
+        'evict: remove the least recently used objects beyond --max-size',
+    )
+    parser.add_argument(
+        '--cache', required=True, metavar='DIR', help='Cache directory'
+    )
+    parser.add_argument(
+        '--max-size',
+        type=parse_size,
+        help='Maximum size of the cache (e.g. 500M or 20G) for evict',
+    )
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.cache):
+        print('ERROR: %s is not a directory' % args.cache, file=sys.stderr)
+        return 1
+    with LstmfCache(args.cache) as cache:
+        if args.command == 'evict':
+            if args.max_size is None:
+                parser.error('evict requires --max-size')
+            print(f'{cache.evict(args.max_size)} objects evicted')
+        print(format_stats(cache.stats()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,296 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Content hash manifest for incremental regeneration of .box and .lstmf files.
+
+Make decides what to rebuild from modification times only, so after an rsync,
+a git checkout or a restore from backup all .box and .lstmf files would be
+rebuilt. The manifest (a SQLite database, usually in OUTPUT_DIR) records for
+each generated file a key computed from the content of its inputs:
+
+* .box: image, .gt.txt, the box generator script and tesstrain.boxes
+* .lstmf: image, .box, page segmentation mode and tesseract version
+
+`refresh` touches every generated file whose recorded key still matches, so
+that Make considers it up to date, and leaves the rest for Make to rebuild.
+`record` stores the keys of the files after a build.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+from tesstrain import boxes, groundtruth
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    path TEXT PRIMARY KEY,
+    key TEXT NOT NULL
+);
+"""
+
+
+def tesseract_version(cmd='tesseract'):
+    """Return the first line of `tesseract --version`, or 'unknown'."""
+    try:
+        proc = subprocess.run(
+            [cmd, '--version'],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    lines = proc.stdout.decode('utf-8', errors='replace').splitlines()
+    return lines[0].strip() if lines else 'unknown'
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _mtimes(*paths):
+    return [os.stat(path).st_mtime_ns for path in paths]
+
+
+def combine_key(*parts):
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+class Manifest:
+    """
+    SQLite backed store of content hashes for the ground truth files and of
+    the input keys of the generated files.
+    """
+
+    def __init__(self, path, jobs=8):
+        self.path = os.fspath(path)
+        self.jobs = jobs
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def digests(self, paths):
+        """
+        Return a dict with the content hash of each existing file in paths.
+
+        Hashes are cached by size and modification time, so only new or
+        touched files are read again (in parallel, which helps on network
+        file systems).
+        """
+        result = {}
+        stale = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            row = self.db.execute(
+                'SELECT size, mtime_ns, digest FROM hashes WHERE path = ?',
+                (path,),
+            ).fetchone()
+            if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+                result[path] = row[2]
+            else:
+                stale.append((path, st))
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.jobs
+        ) as executor:
+            for (path, st), digest in zip(
+                stale, executor.map(file_digest, (p for p, _ in stale))
+            ):
+                result[path] = digest
+                self.db.execute(
+                    'INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)',
+                    (path, st.st_size, st.st_mtime_ns, digest),
+                )
+        return result
+
+    def recorded_key(self, output):
+        row = self.db.execute(
+            'SELECT key FROM outputs WHERE path = ?', (output,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def record_key(self, output, key):
+        """Record key as the key of the inputs of output."""
+        self.db.execute('INSERT OR REPLACE INTO outputs VALUES (?, ?)', (output, key))
+
+    def touch(self, path, t):
+        """Set the modification time of path, keeping its cached hash."""
+        os.utime(path, ns=(t, t))
+        self.db.execute(
+            'UPDATE hashes SET mtime_ns = ? WHERE path = ?', (t, path)
+        )
+
+    def _pairs(self, gt_files):
+        for txt in gt_files:
+            stem = groundtruth.gt_stem(txt)
+            image = groundtruth.find_image(stem)
+            if image:
+                yield image, txt, stem + '.box', stem + '.lstmf'
+
+    def _keys(self, gt_files, box_script, psm, version):
+        """Yield (image, txt, box, lstmf, box key, lstmf key) per pair."""
+        pairs = list(self._pairs(gt_files))
+        # The box scripts are thin wrappers around tesstrain.boxes.
+        script_digest = combine_key(
+            file_digest(box_script), file_digest(boxes.__file__)
+        )
+        digests = self.digests(
+            path for pair in pairs for path in (pair[0], pair[1], pair[2])
+        )
+        for image, txt, box, lstmf in pairs:
+            if image not in digests or txt not in digests:
+                continue
+            box_key = combine_key(
+                'box', digests[image], digests[txt], script_digest
+            )
+            lstmf_key = None
+            if box in digests:
+                lstmf_key = combine_key(
+                    'lstmf', digests[image], digests[box], str(psm), version
+                )
+            yield image, txt, box, lstmf, box_key, lstmf_key
+
+    def refresh(self, gt_files, box_script, psm, version):
+        """
+        Touch the outdated .box and .lstmf files whose inputs did not change
+        since they were recorded. Returns the number of touched files.
+        """
+        touched = 0
+        now = time.time_ns()
+        for image, txt, box, lstmf, box_key, lstmf_key in self._keys(
+            gt_files, box_script, psm, version
+        ):
+            if lstmf_key is None:
+                continue
+            if not groundtruth.is_up_to_date(box, image, txt):
+                if self.recorded_key(box) != box_key:
+                    continue
+                self.touch(box, max(now, *_mtimes(image, txt)))
+                touched += 1
+            if (
+                os.path.exists(lstmf)
+                and not groundtruth.is_up_to_date(lstmf, image, box)
+                and self.recorded_key(lstmf) == lstmf_key
+            ):
+                self.touch(lstmf, max(now, *_mtimes(image, box)))
+                touched += 1
+        self.db.commit()
+        return touched
+
+    def record(self, gt_files, box_script, psm, version):
+        """
+        Record the keys of all .box and .lstmf files which are up to date with
+        their inputs. Returns the number of recorded files.
+        """
+        recorded = 0
+        for image, txt, box, lstmf, box_key, lstmf_key in self._keys(
+            gt_files, box_script, psm, version
+        ):
+            if lstmf_key is None or not groundtruth.is_up_to_date(
+                box, image, txt
+            ):
+                continue
+            self.record_key(box, box_key)
+            recorded += 1
+            if groundtruth.is_up_to_date(lstmf, image, box):
+                self.record_key(lstmf, lstmf_key)
+                recorded += 1
+        self.db.commit()
+        return recorded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tesstrain.manifest',
+        description='Content hash manifest for .box and .lstmf files.',
+    )
+    parser.add_argument(
+        'command',
+        choices=['refresh', 'record'],
+        help='refresh: touch unchanged outputs before a build; '
+        'record: store the keys of the outputs after a build',
+    )
+    parser.add_argument(
+        '--manifest', required=True, help='Path of the SQLite manifest'
+    )
+    parser.add_argument(
+        '--gt-dir', metavar='DIR', help='Use all *.gt.txt files below DIR'
+    )
+    parser.add_argument(
+        '--list',
+        metavar='FILE',
+        help="Use the *.gt.txt files listed in FILE ('-' for stdin)",
+    )
+    parser.add_argument(
+        '--box-script',
+        required=True,
+        help='Box generator script used for the .box files',
+    )
+    parser.add_argument(
+        '--psm', default='13', help='Page segmentation mode (default: 13)'
+    )
+    parser.add_argument(
+        '--tesseract',
+        default='tesseract',
+        help='tesseract executable (used for the version)',
+    )
+    args = parser.parse_args(argv)
+
+    gt_files = []
+    if args.gt_dir:
+        gt_files.extend(groundtruth.find_gt_files(args.gt_dir))
+    if args.list:
+        gt_files.extend(groundtruth.read_gt_list(args.list))
+
+    version = tesseract_version(args.tesseract)
+    with Manifest(args.manifest) as manifest:
+        if args.command == 'refresh':
+            count = manifest.refresh(
+                gt_files, args.box_script, args.psm, version
+            )
+            print(f'{count} unchanged .box/.lstmf files kept')
+        else:
+            count = manifest.record(
+                gt_files, args.box_script, args.psm, version
+            )
+            print(f'{count} .box/.lstmf files recorded')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
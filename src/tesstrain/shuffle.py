@@ -0,0 +1,209 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Seeded shuffling of list files (used by shuffle.py).
+
+shuffle_lines() sorts and shuffles lines in memory with random.shuffle(),
+like shuffle.py always did. For lists larger than the available memory,
+external_shuffle() orders the lines by a keyed hash of the seed and the line
+instead, which is a shuffle as well: the lines are scattered into bucket
+files by ranges of their hash, and every bucket is read and sorted by hash
+on its own (buckets which are still too large are scattered again, unless
+their distinct lines fit, which are sorted with their counts). The
+result is the order of the hashes, so it only depends on the seed and the
+lines, not on the memory limit. Both write their output atomically through
+shuffle_file().
+"""
+
+import hashlib
+import itertools
+import os
+import random
+import shutil
+import tempfile
+
+from tesstrain import groundtruth
+
+# Memory for the lines of one bucket is about this factor times their size.
+LINE_OVERHEAD = 4
+
+# Maximum number of bucket files written at once.
+MAX_BUCKETS = 256
+
+# Smallest and largest buffer of a file. The buffers of all files which are
+# open at once take at most a quarter of the memory limit (but at least
+# MIN_BUFFER_SIZE each).
+MIN_BUFFER_SIZE = 8 * 1024
+BUFFER_SIZE = 1 << 20
+
+
+def shuffle_lines(lines, seed=None):
+    """
+    Return lines sorted and then shuffled with random.shuffle() seeded with
+    seed (like shuffle.py without a memory limit).
+    """
+    lines = sorted(lines)
+    random.Random(seed).shuffle(lines)
+    return lines
+
+
+def _hasher(seed):
+    if seed is None:
+        key = os.urandom(hashlib.blake2b.MAX_KEY_SIZE)
+    else:
+        key = hashlib.blake2b(str(seed).encode('utf-8')).digest()
+
+    def line_hash(line):
+        digest = hashlib.blake2b(line, digest_size=8, key=key).digest()
+        return int.from_bytes(digest, 'big')
+
+    return line_hash
+
+
+def _buffer_size(memory, files=1):
+    """Return the buffer size of each of files files open at once."""
+    return max(MIN_BUFFER_SIZE, min(BUFFER_SIZE, memory // (4 * files)))
+
+
+def _lines(f):
+    """Yield the lines of the binary file f, all ending with a newline."""
+    for line in f:
+        if not line.endswith(b'\n'):
+            line += b'\n'
+        yield line
+
+
+def _count_lines(f, memory):
+    """
+    Return a dict of the distinct lines of the binary file f and their
+    counts, or None (with f positioned where it was before) as soon as the
+    distinct lines need more than memory.
+    """
+    start = f.tell()
+    counts = {}
+    size = 0
+    for line in _lines(f):
+        count = counts.get(line)
+        if count is None:
+            size += len(line)
+            if size * LINE_OVERHEAD > memory:
+                f.seek(start)
+                return None
+            count = 0
+        counts[line] = count + 1
+    return counts
+
+
+def _shuffle_bucket(f, size, out, line_hash, memory, low, high, tmp_dir):
+    """
+    Write the lines of the binary file f (of size bytes) whose hashes are in
+    [low, high) to out in the order of their hashes.
+    """
+    if size * LINE_OVERHEAD <= memory or high - low <= 1:
+        lines = [(line_hash(line), line) for line in _lines(f)]
+        lines.sort()
+        out.writelines(line for _, line in lines)
+        return
+    # Copies of a line share its hash, so they would be scattered into one
+    # bucket again and again. Sort the distinct lines if they fit instead.
+    counts = _count_lines(f, memory)
+    if counts is not None:
+        for _, line in sorted((line_hash(line), line) for line in counts):
+            out.writelines(itertools.repeat(line, counts[line]))
+        return
+    count = min(
+        MAX_BUCKETS,
+        high - low,
+        -(-size * LINE_OVERHEAD // memory) * 2,
+        max(2, memory // (4 * MIN_BUFFER_SIZE)),
+    )
+    width = -(-(high - low) // count)
+    buffering = _buffer_size(memory, count)
+    paths = []
+    buckets = []
+    try:
+        for _ in range(count):
+            fd, path = tempfile.mkstemp(suffix='.bucket', dir=tmp_dir)
+            paths.append(path)
+            buckets.append(os.fdopen(fd, 'wb', buffering=buffering))
+        for line in _lines(f):
+            buckets[(line_hash(line) - low) // width].write(line)
+        # Free the buffers of all buckets before they are shuffled one by one,
+        # so that only the files of the current bucket are open.
+        for bucket in buckets:
+            bucket.close()
+        for i, path in enumerate(paths):
+            bucket_low = low + i * width
+            with open(path, 'rb', buffering=_buffer_size(memory)) as bucket:
+                _shuffle_bucket(
+                    bucket,
+                    os.fstat(bucket.fileno()).st_size,
+                    out,
+                    line_hash,
+                    memory,
+                    bucket_low,
+                    min(high, bucket_low + width),
+                    tmp_dir,
+                )
+            os.unlink(path)
+    finally:
+        for bucket in buckets:
+            bucket.close()
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def external_shuffle(infile, outfile, seed, memory, tmp_dir=None):
+    """
+    Write the lines of the binary file infile to the binary file outfile in
+    an order which is determined by seed (random without a seed), keeping
+    about memory bytes of lines in memory. Temporary files are created in
+    tmp_dir.
+    """
+    if not infile.seekable():
+        spool = tempfile.TemporaryFile(dir=tmp_dir, buffering=_buffer_size(memory))
+        shutil.copyfileobj(infile, spool, _buffer_size(memory))
+        spool.seek(0)
+        infile = spool
+    start = infile.tell()
+    size = infile.seek(0, os.SEEK_END) - start
+    infile.seek(start)
+    _shuffle_bucket(infile, size, outfile, _hasher(seed), memory, 0, 2**64, tmp_dir)
+
+
+def shuffle_file(path, seed=None, output=None, memory=None):
+    """
+    Shuffle the lines of the file path into output (default: path itself),
+    which is replaced atomically. With memory (in bytes), external_shuffle()
+    is used with temporary files next to output, else shuffle_lines().
+    """
+    output = output or path
+    if not memory:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = shuffle_lines(f.readlines(), seed)
+        with groundtruth.open_atomic(
+            output, 'w', encoding='utf-8', newline='\n'
+        ) as out:
+            out.writelines(lines)
+        return
+    buffering = _buffer_size(memory)
+    with groundtruth.open_atomic(output, 'wb', buffering=buffering) as out:
+        with open(path, 'rb', buffering=buffering) as f:
+            external_shuffle(
+                f,
+                out,
+                seed,
+                memory,
+                tmp_dir=os.path.dirname(os.path.abspath(output)),
+            )
@@ -0,0 +1,264 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+In-process feature extraction through the C API of libtesseract (ctypes).
+
+Running `tesseract IMAGE BASE lstm.train` for every image starts a process,
+initializes tesseract and parses its configuration each time. An ApiPool
+keeps initialized API handles instead (one per worker thread at most, as a
+handle must not be used by two threads at once) and lets them write the
+`.lstmf` (or `.tr`) output of one image after the other. ctypes releases the
+GIL during the calls, so the handles work in parallel.
+
+The library is optional: load_library() returns None if it cannot be found,
+and callers fall back to running the tesseract program.
+
+This backend is experimental and not enabled by default. Its output has not
+been compared with the `.lstmf` files written by the tesseract program, and
+reusing a handle for many images relies on resetting `applybox_page` before
+each image so that the training output is not appended to.
+"""
+
+import argparse
+import contextlib
+import ctypes
+import ctypes.util
+import functools
+import os
+import queue
+import sys
+import threading
+
+# Library names to try after ctypes.util.find_library().
+LIBRARY_NAMES = (
+    'libtesseract.so.5',
+    'libtesseract.5.dylib',
+    'libtesseract-5.dll',
+    'tesseract55.dll',
+    'tesseract54.dll',
+    'tesseract53.dll',
+)
+
+# OcrEngineMode OEM_DEFAULT
+OEM_DEFAULT = 3
+
+
+class TessApiError(Exception):
+    """libtesseract failed to initialize or to process an image."""
+
+
+def _prototype(lib, name, restype, *argtypes):
+    func = getattr(lib, name)
+    func.restype = restype
+    func.argtypes = argtypes
+
+
+@functools.lru_cache(maxsize=None)
+def load_library(path=None):
+    """
+    Return libtesseract as a ctypes.CDLL, or None if it is not available.
+    path (or the environment variable TESSTRAIN_LIBTESSERACT) overrides the
+    search.
+    """
+    path = path or os.environ.get('TESSTRAIN_LIBTESSERACT')
+    names = [path] if path else [ctypes.util.find_library('tesseract')]
+    if not path:
+        names.extend(LIBRARY_NAMES)
+    for name in names:
+        if not name:
+            continue
+        try:
+            lib = ctypes.CDLL(name)
+        except OSError:
+            continue
+        try:
+            handle_p = ctypes.c_void_p
+            _prototype(lib, 'TessVersion', ctypes.c_char_p)
+            _prototype(lib, 'TessBaseAPICreate', handle_p)
+            _prototype(lib, 'TessBaseAPIDelete', None, handle_p)
+            _prototype(lib, 'TessBaseAPIEnd', None, handle_p)
+            _prototype(
+                lib,
+                'TessBaseAPIInit1',
+                ctypes.c_int,
+                handle_p,
+                ctypes.c_char_p,
+                ctypes.c_char_p,
+                ctypes.c_int,
+                ctypes.POINTER(ctypes.c_char_p),
+                ctypes.c_int,
+            )
+            _prototype(
+                lib,
+                'TessBaseAPISetVariable',
+                ctypes.c_int,
+                handle_p,
+                ctypes.c_char_p,
+                ctypes.c_char_p,
+            )
+            _prototype(
+                lib, 'TessBaseAPISetPageSegMode', None, handle_p, ctypes.c_int
+            )
+            _prototype(
+                lib, 'TessBaseAPISetOutputName', None, handle_p, ctypes.c_char_p
+            )
+            _prototype(
+                lib,
+                'TessBaseAPIProcessPages',
+                ctypes.c_int,
+                handle_p,
+                ctypes.c_char_p,
+                ctypes.c_char_p,
+                ctypes.c_int,
+                ctypes.c_void_p,
+            )
+        except AttributeError:
+            # Not the C API of tesseract (or a very old version).
+            continue
+        return lib
+    return None
+
+
+def version():
+    """Return the version of libtesseract, or None if it is not available."""
+    lib = load_library()
+    return lib.TessVersion().decode('utf-8') if lib else None
+
+
+def _encode(path):
+    return os.fsencode(path) if path is not None else None
+
+
+class TessApi:
+    """
+    An initialized tesseract API handle, like `tesseract --psm PSM ... CONFIGS`
+    without the image and output base.
+    """
+
+    def __init__(self, lib, datapath=None, language='eng', configs=(), psm=None):
+        self.lib = lib
+        self.handle = lib.TessBaseAPICreate()
+        configs = [_encode(config) for config in configs if config]
+        config_array = (ctypes.c_char_p * max(1, len(configs)))(*configs)
+        result = lib.TessBaseAPIInit1(
+            self.handle,
+            _encode(datapath),
+            language.encode('utf-8'),
+            OEM_DEFAULT,
+            config_array,
+            len(configs),
+        )
+        if result != 0:
+            self.close()
+            raise TessApiError(
+                'could not initialize tesseract (datapath %s, language %s)'
+                % (datapath, language)
+            )
+        if psm is not None:
+            lib.TessBaseAPISetPageSegMode(self.handle, int(psm))
+
+    def process(self, image, outbase):
+        """Process image and write the output files for outbase."""
+        if self.handle is None:
+            raise TessApiError('tesseract API handle is closed')
+        # Training output is only appended to for the later pages of a
+        # multi-page image, make sure the first page starts a new file.
+        self.lib.TessBaseAPISetVariable(self.handle, b'applybox_page', b'0')
+        self.lib.TessBaseAPISetOutputName(self.handle, _encode(outbase))
+        if not self.lib.TessBaseAPIProcessPages(
+            self.handle, _encode(image), None, 0, None
+        ):
+            raise TessApiError('tesseract failed to process %s' % image)
+
+    def close(self):
+        if self.handle is not None:
+            self.lib.TessBaseAPIEnd(self.handle)
+            self.lib.TessBaseAPIDelete(self.handle)
+            self.handle = None
+
+
+class ApiPool:
+    """
+    Pool of TessApi handles with the same initialization, created on demand
+    up to one per concurrent caller and reused afterwards.
+    """
+
+    def __init__(self, lib, datapath=None, language='eng', configs=(), psm=None):
+        self.lib = lib
+        self.init_args = (datapath, language, tuple(configs), psm)
+        self.idle = queue.LifoQueue()
+        self.handles = []
+        self.lock = threading.Lock()
+        # Set when a handle failed to initialize, which will not get better.
+        self.error = None
+
+    @classmethod
+    def create(cls, datapath=None, language='eng', configs=(), psm=None):
+        """Return a pool, or None if libtesseract is not available."""
+        lib = load_library()
+        if lib is None:
+            return None
+        return cls(lib, datapath, language, configs, psm)
+
+    @contextlib.contextmanager
+    def api(self):
+        """Borrow an initialized TessApi for the with block."""
+        if self.error:
+            raise TessApiError(self.error)
+        try:
+            api = self.idle.get_nowait()
+        except queue.Empty:
+            try:
+                api = TessApi(self.lib, *self.init_args)
+            except TessApiError as e:
+                self.error = str(e)
+                raise
+            with self.lock:
+                self.handles.append(api)
+        try:
+            yield api
+        finally:
+            self.idle.put(api)
+
+    def process(self, image, outbase):
+        """Process image with a pooled handle (see TessApi.process)."""
+        with self.api() as api:
+            api.process(image, outbase)
+
+    def close(self):
+        with self.lock:
+            for api in self.handles:
+                api.close()
+            self.handles = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tesstrain.tessapi',
+        description='Check whether libtesseract can be used in-process.',
+    )
+    parser.parse_args(argv)
+    lib_version = version()
+    if lib_version is None:
+        print('libtesseract not found, the tesseract program will be used')
+        return 1
+    print('libtesseract %s' % lib_version)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,220 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Parallel conversion of .checkpoint files to best and fast .traineddata.
+
+`make traineddata` used to run `lstmtraining --stop_training` twice for every
+checkpoint, one after the other unless make was given -j. `convert_all` runs
+the best (float) and the fast (--convert_to_int) conversion of a checkpoint
+in one task, on a pool with a task per CPU.
+
+An output is up to date if it is newer than the checkpoint and the proto
+model, and if the manifest (see tesstrain.manifest) records the key of the
+content of both for it, so restored or copied files with new modification
+times are converted again. Outputs are written to a temporary file first.
+"""
+
+import argparse
+import concurrent.futures
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from tesstrain import groundtruth, manifest
+
+
+def convert(checkpoint, traineddata, output, fast=False, lstmtraining='lstmtraining'):
+    """
+    Write output from checkpoint with the proto model traineddata, converted
+    to integer (fast) if fast is set.
+    """
+    tmp = '%s.%d-%d.tmp' % (output, os.getpid(), threading.get_ident())
+    cmd = [
+        lstmtraining,
+        '--stop_training',
+        '--continue_from',
+        checkpoint,
+        '--traineddata',
+        traineddata,
+        '--model_output',
+        tmp,
+    ]
+    if fast:
+        cmd.append('--convert_to_int')
+    # One conversion uses one CPU, the pool runs one per CPU.
+    env = dict(os.environ, OMP_THREAD_LIMIT='1')
+    try:
+        proc = subprocess.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env
+        )
+        if proc.returncode != 0 or not os.path.exists(tmp):
+            raise RuntimeError(
+                '%s failed with return code %d: %s'
+                % (
+                    lstmtraining,
+                    proc.returncode,
+                    proc.stdout.decode('utf-8', errors='replace').strip(),
+                )
+            )
+        os.replace(tmp, output)
+    finally:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+
+
+def _convert_checkpoint(jobs, traineddata, lstmtraining):
+    for checkpoint, output, fast in jobs:
+        convert(checkpoint, traineddata, output, fast, lstmtraining)
+
+
+def output_name(checkpoint):
+    """Return the name of the .traineddata files of checkpoint."""
+    name = os.path.basename(checkpoint)
+    if name.endswith('.checkpoint'):
+        name = name[: -len('.checkpoint')]
+    return name + '.traineddata'
+
+
+def convert_all(
+    checkpoints,
+    traineddata,
+    manifest_path,
+    best_dir=None,
+    fast_dir=None,
+    jobs=0,
+    lstmtraining='lstmtraining',
+):
+    """
+    Convert the checkpoints to .traineddata files in best_dir and fast_dir
+    (either may be None), skipping the up to date ones, with up to jobs
+    (0 for the number of CPUs) checkpoints at once.
+
+    Returns (converted, skipped, errors) with the number of converted and up
+    to date checkpoints and a dict with the error of each failed checkpoint.
+    """
+    targets = [(d, fast) for d, fast in ((best_dir, False), (fast_dir, True)) if d]
+    for directory, _ in targets:
+        os.makedirs(directory, exist_ok=True)
+    jobs = jobs or os.cpu_count() or 1
+    errors = {}
+    converted = 0
+    with manifest.Manifest(manifest_path, jobs) as m:
+        digests = m.digests([traineddata, *checkpoints])
+        tasks = {}
+        keys = {}
+        for checkpoint in checkpoints:
+            outputs = []
+            for directory, fast in targets:
+                output = os.path.join(directory, output_name(checkpoint))
+                key = manifest.combine_key(
+                    'traineddata',
+                    digests[checkpoint],
+                    digests[traineddata],
+                    'fast' if fast else 'best',
+                )
+                if groundtruth.is_up_to_date(
+                    output, checkpoint, traineddata
+                ) and m.recorded_key(output) == key:
+                    continue
+                outputs.append((checkpoint, output, fast))
+                keys[output] = key
+            if outputs:
+                tasks[checkpoint] = outputs
+        m.commit()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(
+                    _convert_checkpoint, outputs, traineddata, lstmtraining
+                ): checkpoint
+                for checkpoint, outputs in tasks.items()
+            }
+            for future in concurrent.futures.as_completed(futures):
+                checkpoint = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[checkpoint] = e
+                    continue
+                converted += 1
+                for _, output, _ in tasks[checkpoint]:
+                    m.record_key(output, keys[output])
+                m.commit()
+    return converted, len(checkpoints) - len(tasks), errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tesstrain.traineddata',
+        description='Convert .checkpoint files to best and fast .traineddata '
+        'files in parallel.',
+    )
+    parser.add_argument('checkpoints', nargs='*', help='.checkpoint files')
+    parser.add_argument(
+        '--traineddata',
+        required=True,
+        metavar='FILE',
+        help='Proto model (.traineddata) of the training',
+    )
+    parser.add_argument(
+        '--manifest',
+        required=True,
+        metavar='FILE',
+        help='SQLite manifest with the content keys of the outputs',
+    )
+    parser.add_argument(
+        '--best-dir', metavar='DIR', help='Write best (float) models to DIR'
+    )
+    parser.add_argument(
+        '--fast-dir', metavar='DIR', help='Write fast (integer) models to DIR'
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=0,
+        help='Number of checkpoints converted at once (default: number of CPUs)',
+    )
+    parser.add_argument(
+        '--lstmtraining', default='lstmtraining', help='lstmtraining executable'
+    )
+    args = parser.parse_args(argv)
+    if not (args.best_dir or args.fast_dir):
+        parser.error('--best-dir or --fast-dir is required')
+
+    for path in [args.traineddata, *args.checkpoints]:
+        if not os.path.exists(path):
+            print('ERROR: %s not found' % path, file=sys.stderr)
+            return 1
+    start = time.perf_counter()
+    converted, skipped, errors = convert_all(
+        args.checkpoints,
+        args.traineddata,
+        args.manifest,
+        best_dir=args.best_dir,
+        fast_dir=args.fast_dir,
+        jobs=args.jobs,
+        lstmtraining=args.lstmtraining,
+    )
+    for checkpoint, error in sorted(errors.items()):
+        print('ERROR: %s: %s' % (checkpoint, error), file=sys.stderr)
+    seconds = time.perf_counter() - start
+    print(
+        f'{converted} checkpoints converted in {seconds:.1f} s '
+        f'({converted / seconds:.2f} checkpoints/s), {skipped} up to date, '
+        f'{len(errors)} failed'
+    )
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
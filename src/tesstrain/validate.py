@@ -0,0 +1,231 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Validation of line ground truth before box generation.
+
+Every `.gt.txt` file and its line image are checked in a process pool:
+
+* decode: the text must be valid UTF-8
+* lines: the text must be exactly one line
+* empty: the line must not be empty
+* normalization: the line should be in NFC (can be repaired with --fix)
+* image: a line image must exist and its header must be readable
+* size: the image must not be empty and should be wide enough for the text
+
+Errors make the pair unusable for training and are written to the quarantine
+list, which the Makefile leaves out of ALL_FILES. All findings are written to
+a tab separated report.
+"""
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import unicodedata
+
+from tesstrain import groundtruth, imagesize
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# Height to which tesseract scales line images for the default network
+# specification, and the horizontal reduction of its Mp3,3 layer.
+LSTM_INPUT_HEIGHT = 36
+LSTM_WIDTH_REDUCTION = 3
+
+# Line images lower than this are reported.
+MIN_HEIGHT = 8
+
+REPORT_HEADER = 'path\tseverity\tcheck\tmessage\n'
+
+
+def check_text(txt, fix=False):
+    """
+    Check the ground truth text file txt. Returns (line, findings) with the
+    line (None if it is unusable) and a list of (severity, check, message).
+    """
+    findings = []
+    with open(txt, 'rb') as f:
+        data = f.read()
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        return None, [(ERROR, 'decode', str(e))]
+    lines = text.strip().split('\n')
+    if len(lines) != 1:
+        return None, [(ERROR, 'lines', 'text has %d lines, not 1' % len(lines))]
+    line = lines[0].strip()
+    if not line:
+        return None, [(ERROR, 'empty', 'text is empty')]
+    nfc = unicodedata.normalize('NFC', line)
+    if nfc != line:
+        if fix:
+            groundtruth.write_atomic(txt, nfc + '\n')
+            findings.append((WARNING, 'normalization', 'converted to NFC'))
+        else:
+            findings.append((WARNING, 'normalization', 'text is not in NFC'))
+    return nfc, findings
+
+
+def check_image(image, line, min_height=MIN_HEIGHT):
+    """Check the line image for the text line. Returns a list of findings."""
+    try:
+        width, height = imagesize.probe_size(image)
+    except Exception as e:
+        return [(ERROR, 'image', '%s: %s' % (image, e))]
+    if width <= 0 or height <= 0:
+        return [(ERROR, 'size', '%s: image is %dx%d' % (image, width, height))]
+    findings = []
+    if height < min_height:
+        findings.append(
+            (
+                WARNING,
+                'size',
+                '%s: height %d is below %d' % (image, height, min_height),
+            )
+        )
+    if line:
+        steps = width * LSTM_INPUT_HEIGHT // height // LSTM_WIDTH_REDUCTION
+        if steps < len(line):
+            findings.append(
+                (
+                    WARNING,
+                    'size',
+                    '%s: %dx%d is probably too narrow for %d characters'
+                    % (image, width, height, len(line)),
+                )
+            )
+    return findings
+
+
+def check_pair(txt, fix=False, min_height=MIN_HEIGHT):
+    """Return the list of findings for a ground truth text file and its image."""
+    try:
+        line, findings = check_text(txt, fix=fix)
+    except OSError as e:
+        return [(ERROR, 'decode', str(e))]
+    image = groundtruth.find_image(groundtruth.gt_stem(txt))
+    if image is None:
+        findings.append((ERROR, 'image', 'no line image found'))
+    else:
+        findings.extend(check_image(image, line, min_height=min_height))
+    return findings
+
+
+def _check_task(task):
+    txt, fix, min_height = task
+    return txt, check_pair(txt, fix=fix, min_height=min_height)
+
+
+def validate(gt_files, jobs=0, fix=False, min_height=MIN_HEIGHT):
+    """
+    Check all ground truth files in gt_files using a process pool with the
+    given number of jobs (0 for all CPUs). Yields (txt, findings) in order.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    chunksize = max(1, min(256, len(gt_files) // (4 * jobs)))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(
+            _check_task,
+            ((txt, fix, min_height) for txt in gt_files),
+            chunksize=chunksize,
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python3 -m tesstrain.validate',
+        description='Validate line ground truth (image / .gt.txt pairs).',
+    )
+    parser.add_argument(
+        '--gt-dir', metavar='DIR', help='Check all *.gt.txt files below DIR'
+    )
+    parser.add_argument(
+        '--list',
+        metavar='FILE',
+        help="Check the *.gt.txt files listed in FILE ('-' for stdin)",
+    )
+    parser.add_argument(
+        '--report',
+        metavar='FILE',
+        help='Write all findings as tab separated values to FILE',
+    )
+    parser.add_argument(
+        '--quarantine',
+        metavar='FILE',
+        help='Write the *.gt.txt files with errors to FILE (one per line)',
+    )
+    parser.add_argument(
+        '--strict',
+        action='store_true',
+        help='Treat warnings like errors',
+    )
+    parser.add_argument(
+        '--fix',
+        action='store_true',
+        help='Repair what can be repaired (normalization to NFC) in place',
+    )
+    parser.add_argument(
+        '--min-height',
+        type=int,
+        default=MIN_HEIGHT,
+        help='Warn about line images lower than this (default: %(default)s)',
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=0,
+        help='Number of parallel processes (default: number of CPUs)',
+    )
+    args = parser.parse_args(argv)
+    if not (args.gt_dir or args.list):
+        parser.error('--gt-dir or --list is required')
+
+    gt_files = []
+    if args.gt_dir:
+        gt_files.extend(groundtruth.find_gt_files(args.gt_dir))
+    if args.list:
+        gt_files.extend(groundtruth.read_gt_list(args.list))
+
+    report = []
+    quarantine = []
+    counts = {ERROR: 0, WARNING: 0}
+    for txt, findings in validate(
+        gt_files, jobs=args.jobs, fix=args.fix, min_height=args.min_height
+    ):
+        bad = False
+        for severity, check, message in findings:
+            counts[severity] += 1
+            message = ' '.join(message.split())
+            report.append('\t'.join((txt, severity, check, message)) + '\n')
+            if severity == ERROR or args.strict:
+                bad = True
+            if severity == ERROR:
+                print('ERROR: %s: %s' % (txt, message), file=sys.stderr)
+        if bad:
+            quarantine.append(txt + '\n')
+
+    if args.report:
+        groundtruth.write_atomic(args.report, REPORT_HEADER + ''.join(report))
+    if args.quarantine:
+        groundtruth.write_atomic(args.quarantine, ''.join(quarantine))
+    print(
+        f'{len(gt_files)} pairs checked, {counts[ERROR]} errors, '
+        f'{counts[WARNING]} warnings, {len(quarantine)} pairs quarantined'
+    )
+    if quarantine and not args.quarantine:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -16,6 +16,7 @@ Actual execution logic.
 
 import logging
 import sys
+import time
 from typing import List, Optional
 
 from tesstrain import language_specific
@@ -24,12 +25,15 @@ from tesstrain.arguments import (
     verify_parameters_and_handle_defaults,
 )
 from tesstrain.generate import (
+    check_toolchain,
     cleanup,
     initialize_fontconfig,
     make_lstmdata,
     phase_E_extract_features,
     phase_I_generate_image,
+    phase_IUE_pipeline,
     phase_UP_generate_unicharset,
+    toolchain_programs,
 )
 
 log = logging.getLogger()
@@ -43,12 +47,21 @@ def run_from_context(ctx):
     log.info(f'=== Starting training for language {ctx.lang_code}')
     ctx = language_specific.set_lang_specific_parameters(ctx, ctx.lang_code)
 
+    check_toolchain(toolchain_programs(ctx))
     initialize_fontconfig(ctx)
-    phase_I_generate_image(ctx, par_factor=8)
-    phase_UP_generate_unicharset(ctx)
+    start = time.perf_counter()
+    if ctx.pipeline:
+        phase_IUE_pipeline(ctx, ['lstm.train'], 'lstmf')
+    else:
+        phase_I_generate_image(ctx)
+        phase_UP_generate_unicharset(ctx)
+        if ctx.linedata:
+            phase_E_extract_features(ctx, ['lstm.train'], 'lstmf')
+    seconds = time.perf_counter() - start
+    mode = 'pipeline' if ctx.pipeline else 'phased'
+    log.info(f'Images, unicharset and features took {seconds:.1f} s ({mode} mode)')
 
     if ctx.linedata:
-        phase_E_extract_features(ctx, ['lstm.train'], 'lstmf')
         make_lstmdata(ctx)
 
 
@@ -70,6 +83,12 @@ def run(
     tessdata_directory: Optional[str] = None,
     exposures: Optional[List[int]] = None,
     point_size: int = 12,
+    extract_backend: str = 'subprocess',
+    extract_jobs: int = 0,
+    extract_memory_mb: int = 500,
+    par_factor: int = 8,
+    pipeline: bool = False,
+    command_timeout: float = 0,
 ):
     """
     :param fonts: A list of font names to train on. These need to be recognizable by
@@ -103,6 +122,21 @@ def run(
     :param exposures: A list of exposure levels to use (e.g. `[-1, 0, 1]`). If
                       unspecified, language-specific ones will be used.
     :param point_size: Size of printed text.
+    :param extract_backend: `subprocess` to run tesseract for each image during
+                            feature extraction, or `api` to use libtesseract
+                            in-process (experimental, falling back to
+                            `subprocess` if the library is not available).
+    :param extract_jobs: Number of parallel tesseract processes for feature
+                         extraction. If 0, one per available CPU is used, as far
+                         as they fit into the available memory with
+                         `extract_memory_mb` each.
+    :param extract_memory_mb: Memory in MB to reserve for each tesseract process
+                              when choosing the number of workers.
+    :param par_factor: Number of fonts and exposures rendered in parallel.
+    :param pipeline: Extract the features of each image as soon as it is
+                     rendered, while the other images are still rendering.
+    :param command_timeout: Abort if a text2image or tesseract process for one font,
+                            exposure or image runs for more seconds (0: no limit).
     """
     ctx = TrainingArguments()
     ctx.fonts = fonts
@@ -122,6 +156,12 @@ def run(
     ctx.tessdata_dir = tessdata_directory
     ctx.exposures = exposures
     ctx.ptsize = point_size
+    ctx.extract_backend = extract_backend
+    ctx.extract_jobs = extract_jobs
+    ctx.extract_memory_mb = extract_memory_mb
+    ctx.par_factor = par_factor
+    ctx.pipeline = pipeline
+    ctx.command_timeout = command_timeout
 
     verify_parameters_and_handle_defaults(ctx)
 
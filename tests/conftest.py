@@ -0,0 +1,5 @@
+import pathlib
+import sys
+
+# Use the package from the source tree, like the scripts in the top directory.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / 'src'))
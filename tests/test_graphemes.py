@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from tesstrain import benchmark, graphemes
+
+
+@pytest.mark.parametrize(
+    'text, clusters',
+    [
+        ('e\u0301 x', ['e\u0301', ' ', 'x']),
+        ('a \u0301b', ['a', ' \u0301', 'b']),
+        ('a\r\nb', ['a', '\r\n', 'b']),
+        # Devanagari KSSA with vowel sign I
+        ('\u0915\u094d\u0937\u093f', ['\u0915\u094d\u0937\u093f']),
+        # Bengali conjunct SKA
+        (
+            '\u09a8\u09ae\u09b8\u09cd\u0995\u09be\u09b0',
+            ['\u09a8', '\u09ae', '\u09b8\u09cd\u0995\u09be', '\u09b0'],
+        ),
+        # Hangul syllable, precomposed and as jamo
+        ('\ud55c\u1112\u1161\u11ab', ['\ud55c', '\u1112\u1161\u11ab']),
+        ('\U0001f1e9\U0001f1ea\U0001f1eb', ['\U0001f1e9\U0001f1ea', '\U0001f1eb']),
+        ('\U0001f469\u200d\U0001f4bb!', ['\U0001f469\u200d\U0001f4bb', '!']),
+    ],
+)
+def test_clusters(text, clusters):
+    assert graphemes.Segmenter().split(text) == clusters
+
+
+def test_hindi_like_splitclusters():
+    # Hindi text is segmented like by the former splitclusters().
+    rng = random.Random(0)
+    lines = benchmark._corpus(
+        rng, 2000, lambda rng: benchmark._indic_word(rng, benchmark.INDIC_SCRIPTS[0])
+    )
+    expected = [list(benchmark._splitclusters(line)) for line in lines]
+    assert graphemes.Segmenter().segment(lines) == expected
+
+
+def test_cached_and_uncached_agree():
+    rng = random.Random(1)
+    words = [
+        ''.join(rng.choices('\u0915\u0937\u094d\u093f\u0941 a\u0301', k=5))
+        for _ in range(50)
+    ]
+    lines = [' '.join(rng.choices(words, k=8)) for _ in range(500)]
+    cached = graphemes.Segmenter()
+    uncached = graphemes.Segmenter()
+    uncached.use_cache = False
+    uncached.SAMPLE_LINES = 10**9
+    assert cached.segment(lines) == uncached.segment(lines)
+
+
+def test_split_word_needs_context():
+    segmenter = graphemes.Segmenter()
+    assert segmenter.split_word('\u0301a') is None
+    assert segmenter.split_word('ab') == ['a', 'b']
+
+
+def test_like_regex():
+    regex = pytest.importorskip('regex')
+    rng = random.Random(2)
+    alphabet = [chr(cp) for cp in range(0x0900, 0x09FF)]
+    alphabet += [chr(cp) for cp in range(0x1100, 0x1200)]
+    alphabet += list('\u200c\u200d \r\na\U0001f1e9\U0001f1ea\U0001f469\U0001f4bb')
+    segmenter = graphemes.Segmenter()
+    for _ in range(2000):
+        text = ''.join(rng.choices(alphabet, k=20))
+        assert segmenter.split(text) == regex.findall(r'\X', text), repr(text)
@@ -0,0 +1,23 @@
+import os
+import stat
+
+from tesstrain import groundtruth
+
+
+def test_write_atomic_keeps_mode(tmp_path):
+    path = tmp_path / 'line.gt.txt'
+    path.write_text('old\n')
+    os.chmod(path, 0o640)
+    groundtruth.write_atomic(str(path), 'new\n')
+    assert path.read_text() == 'new\n'
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    assert os.listdir(tmp_path) == ['line.gt.txt']
+
+
+def test_write_if_changed(tmp_path):
+    path = str(tmp_path / 'list')
+    assert groundtruth.write_if_changed(path, 'a\n')
+    os.utime(path, ns=(10**18, 10**18))
+    assert not groundtruth.write_if_changed(path, 'a\n')
+    assert os.stat(path).st_mtime_ns == 10**18
+    assert groundtruth.write_if_changed(path, 'b\n')
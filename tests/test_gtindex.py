@@ -0,0 +1,66 @@
+import os
+import shutil
+
+from tesstrain import gtindex
+
+
+def make_gt(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write('text\n')
+
+
+def test_refresh_index(tmp_path):
+    gt_dir = str(tmp_path / 'gt')
+    index = str(tmp_path / 'out' / 'gt.index')
+    files = [
+        os.path.join(gt_dir, 'a.gt.txt'),
+        os.path.join(gt_dir, 'book1', 'b.gt.txt'),
+        os.path.join(gt_dir, 'book1', 'page', 'c.gt.txt'),
+        os.path.join(gt_dir, 'book2', 'd.gt.txt'),
+    ]
+    for path in files:
+        make_gt(path)
+    with open(os.path.join(gt_dir, 'a.png'), 'w'):
+        pass
+    assert gtindex.refresh_index(index, gt_dir) == sorted(files)
+
+    # Added, removed and renamed files and directories are noticed.
+    make_gt(os.path.join(gt_dir, 'book1', 'page', 'e.gt.txt'))
+    os.unlink(files[0])
+    shutil.rmtree(os.path.join(gt_dir, 'book2'))
+    os.rename(files[1], os.path.join(gt_dir, 'book1', 'f.gt.txt'))
+    assert gtindex.refresh_index(index, gt_dir) == [
+        os.path.join(gt_dir, 'book1', 'f.gt.txt'),
+        os.path.join(gt_dir, 'book1', 'page', 'c.gt.txt'),
+        os.path.join(gt_dir, 'book1', 'page', 'e.gt.txt'),
+    ]
+
+
+def test_unchanged_directories_are_not_listed(tmp_path):
+    gt_dir = str(tmp_path / 'gt')
+    index = str(tmp_path / 'gt.index')
+    for book in ('book1', 'book2'):
+        make_gt(os.path.join(gt_dir, book, 'a.gt.txt'))
+    # Old modification times, so that the directories are not listed again
+    # for having been modified just before the refresh.
+    for path in (gt_dir, os.path.join(gt_dir, 'book1'), os.path.join(gt_dir, 'book2')):
+        os.utime(path, ns=(10**18, 10**18))
+    with gtindex.GtIndex(index, gt_dir) as index_:
+        assert index_.refresh() == 3
+        assert index_.refresh() == 0
+        make_gt(os.path.join(gt_dir, 'book2', 'b.gt.txt'))
+        assert index_.refresh() == 1
+        assert index_.stats() == (3, 3)
+
+
+def test_other_gt_dir(tmp_path):
+    index = str(tmp_path / 'gt.index')
+    make_gt(str(tmp_path / 'gt1' / 'a.gt.txt'))
+    make_gt(str(tmp_path / 'gt2' / 'b.gt.txt'))
+    assert gtindex.refresh_index(index, str(tmp_path / 'gt1')) == [
+        str(tmp_path / 'gt1' / 'a.gt.txt')
+    ]
+    assert gtindex.refresh_index(index, str(tmp_path / 'gt2')) == [
+        str(tmp_path / 'gt2' / 'b.gt.txt')
+    ]
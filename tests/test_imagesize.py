@@ -0,0 +1,38 @@
+import pytest
+
+from tesstrain import imagesize
+
+Image = pytest.importorskip('PIL.Image')
+
+
+@pytest.mark.parametrize(
+    'name, mode',
+    [
+        ('line.png', 'L'),
+        ('line.bin.png', '1'),
+        ('line.tif', 'L'),
+        ('line.tif', '1'),
+        ('line.jpg', 'RGB'),
+    ],
+)
+def test_probe_size_like_pil(name, mode, tmp_path):
+    path = tmp_path / name
+    Image.new(mode, (1234, 56)).save(path)
+    assert imagesize.probe_size(path) == (1234, 56)
+    assert imagesize.image_size(path) == (1234, 56)
+
+
+def test_truncated_header(tmp_path):
+    path = tmp_path / 'line.png'
+    Image.new('L', (10, 5)).save(path)
+    path.write_bytes(path.read_bytes()[:20])
+    with pytest.raises(Exception):
+        imagesize.probe_size(path)
+
+
+def test_image_size_sees_changes(tmp_path):
+    path = tmp_path / 'line.png'
+    Image.new('L', (10, 5)).save(path)
+    assert imagesize.image_size(path) == (10, 5)
+    Image.new('L', (300, 40)).save(path)
+    assert imagesize.image_size(path) == (300, 40)
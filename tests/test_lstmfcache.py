@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+from tesstrain import lstmfcache, sizes
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    return (
+        write(tmp_path / 'a.png', b'image a'),
+        write(tmp_path / 'a.box', b'box a'),
+        write(tmp_path / 'b.png', b'image b'),
+        write(tmp_path / 'b.box', b'box b'),
+    )
+
+
+def test_lstmf_key(inputs):
+    image_a, box_a, image_b, box_b = inputs
+    key = lstmfcache.lstmf_key([image_a], [box_a], 13, 'tesseract 5.3.0')
+    assert key == lstmfcache.lstmf_key([image_a], [box_a], 13, 'tesseract 5.3.0')
+    keys = {
+        key,
+        lstmfcache.lstmf_key([image_a], [box_a], 7, 'tesseract 5.3.0'),
+        lstmfcache.lstmf_key([image_a], [box_a], 13, 'tesseract 5.4.0'),
+        lstmfcache.lstmf_key([image_a], [box_b], 13, 'tesseract 5.3.0'),
+        lstmfcache.lstmf_key([image_a, image_b], [box_a, box_b], 13, '5'),
+        lstmfcache.lstmf_key([image_b, image_a], [box_b, box_a], 13, '5'),
+    }
+    assert len(keys) == 6
+
+
+def test_key_depends_on_content_only(inputs, tmp_path):
+    image_a, box_a, _, _ = inputs
+    copy = write(tmp_path / 'copy.png', b'image a')
+    assert lstmfcache.lstmf_key([image_a], [box_a], 13, '5') == (
+        lstmfcache.lstmf_key([copy], [box_a], 13, '5')
+    )
+
+
+def test_store_and_fetch(tmp_path):
+    lstmf = write(tmp_path / 'line.lstmf', b'features')
+    with lstmfcache.LstmfCache(tmp_path / 'cache') as cache:
+        assert not cache.fetch('ab' * 32, str(tmp_path / 'miss.lstmf'))
+        cache.store('ab' * 32, lstmf)
+        dest = tmp_path / 'other' / 'line.lstmf'
+        dest.parent.mkdir()
+        assert cache.fetch('ab' * 32, str(dest))
+        assert dest.read_bytes() == b'features'
+        stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['stored']) == (1, 1, 1)
+    assert (stats['objects'], stats['size']) == (1, len(b'features'))
+
+
+def test_fetch_keeps_dest_newer_than_sources(tmp_path):
+    lstmf = write(tmp_path / 'line.lstmf', b'features')
+    os.utime(lstmf, ns=(10**18, 10**18))
+    box = write(tmp_path / 'line.box', b'box')
+    os.utime(box, ns=(2 * 10**18, 2 * 10**18))
+    with lstmfcache.LstmfCache(tmp_path / 'cache') as cache:
+        cache.store('cd' * 32, lstmf)
+        dest = tmp_path / 'dest.lstmf'
+        assert cache.fetch('cd' * 32, str(dest), box)
+        assert os.stat(dest).st_mtime_ns >= 2 * 10**18
+        assert os.stat(cache.object_path('cd' * 32)).st_mtime_ns == 10**18
+
+
+def test_size_and_eviction(tmp_path):
+    with lstmfcache.LstmfCache(tmp_path / 'cache') as cache:
+        for i in range(5):
+            src = write(tmp_path / ('%d.lstmf' % i), b'x' * 100)
+            cache.store('%02d' % i * 32, src)
+        # Storing a key again replaces its object.
+        cache.store('00' * 32, write(tmp_path / 'new.lstmf', b'x' * 50))
+        assert cache.size() == 450
+        assert cache.evict(300) == 2
+        assert cache.size() == 250
+        assert not cache.fetch('01' * 32, str(tmp_path / 'evicted.lstmf'))
+        assert cache.stats()['objects'] == 3
+    # The size is kept when the cache is opened again.
+    with lstmfcache.LstmfCache(tmp_path / 'cache', max_size=200) as cache:
+        assert cache.size() == 250
+        cache.store('05' * 32, write(tmp_path / '5.lstmf', b'x' * 100))
+        assert cache.size() <= 200 * lstmfcache.EVICT_TO
+
+
+@pytest.mark.parametrize(
+    'text, size',
+    [('0', 0), ('500', 500), ('2K', 2048), ('1.5M', 3 << 19), ('20GiB', 20 << 30)],
+)
+def test_parse_size(text, size):
+    assert sizes.parse_size(text) == size
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        sizes.parse_size('much')
@@ -0,0 +1,80 @@
+import os
+import pathlib
+
+from tesstrain import groundtruth, manifest
+
+BOX_SCRIPT = str(
+    pathlib.Path(__file__).resolve().parent.parent / 'generate_line_box.py'
+)
+
+T = 10**18
+
+
+def make_pair(gt_dir, name, t):
+    """Write an up to date line pair with its .box and .lstmf files."""
+    stem = os.path.join(gt_dir, name)
+    for ext, data, mtime in (
+        ('.png', b'image ' + name.encode(), t),
+        ('.gt.txt', b'text\n', t),
+        ('.box', b'box', t + 1),
+        ('.lstmf', b'features', t + 2),
+    ):
+        with open(stem + ext, 'wb') as f:
+            f.write(data)
+        os.utime(stem + ext, ns=(mtime, mtime))
+    return stem
+
+
+def touch(path, t):
+    os.utime(path, ns=(t, t))
+
+
+def test_refresh_touches_unchanged_outputs(tmp_path):
+    stems = [make_pair(str(tmp_path), 'line%d' % i, T) for i in range(3)]
+    gt_files = [stem + '.gt.txt' for stem in stems]
+    with manifest.Manifest(tmp_path / 'manifest.sqlite') as m:
+        assert m.record(gt_files, BOX_SCRIPT, 13, '5.3.0') == 6
+        assert m.refresh(gt_files, BOX_SCRIPT, 13, '5.3.0') == 0
+
+    # A copy of the tree: same content, but the inputs are newer.
+    for stem in stems:
+        touch(stem + '.png', T + 10)
+        touch(stem + '.gt.txt', T + 10)
+    # Changed text, its .box file has to be made again.
+    with open(stems[2] + '.gt.txt', 'w') as f:
+        f.write('other text\n')
+    touch(stems[2] + '.gt.txt', T + 10)
+
+    with manifest.Manifest(tmp_path / 'manifest.sqlite') as m:
+        assert m.refresh(gt_files, BOX_SCRIPT, 13, '5.3.0') == 4
+    for stem in stems[:2]:
+        assert groundtruth.is_up_to_date(stem + '.box', stem + '.png', stem + '.gt.txt')
+        assert groundtruth.is_up_to_date(stem + '.lstmf', stem + '.png', stem + '.box')
+    assert not groundtruth.is_up_to_date(
+        stems[2] + '.box', stems[2] + '.png', stems[2] + '.gt.txt'
+    )
+
+
+def test_refresh_needs_same_psm_and_version(tmp_path):
+    stem = make_pair(str(tmp_path), 'line', T)
+    gt_files = [stem + '.gt.txt']
+    with manifest.Manifest(tmp_path / 'manifest.sqlite') as m:
+        m.record(gt_files, BOX_SCRIPT, 13, '5.3.0')
+    touch(stem + '.box', T + 10)
+    with manifest.Manifest(tmp_path / 'manifest.sqlite') as m:
+        assert m.refresh(gt_files, BOX_SCRIPT, 7, '5.3.0') == 0
+        assert m.refresh(gt_files, BOX_SCRIPT, 13, '5.4.0') == 0
+        assert m.refresh(gt_files, BOX_SCRIPT, 13, '5.3.0') == 1
+
+
+def test_digests_are_cached(tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text('a')
+    with manifest.Manifest(tmp_path / 'manifest.sqlite') as m:
+        digest = m.digests([str(path)])[str(path)]
+        assert digest == manifest.file_digest(str(path))
+        assert m.digests([str(path), str(tmp_path / 'missing')]) == {
+            str(path): digest
+        }
+        path.write_text('b')
+        assert m.digests([str(path)])[str(path)] != digest
@@ -0,0 +1,68 @@
+import io
+import pathlib
+import random
+import subprocess
+import sys
+
+import pytest
+
+from tesstrain import shuffle
+
+SCRIPT = pathlib.Path(__file__).resolve().parent.parent / 'shuffle.py'
+
+
+def baseline_shuffle(lines, seed):
+    """The order of the original shuffle.py."""
+    random.seed(seed)
+    lines = sorted(lines)
+    random.shuffle(lines)
+    return lines
+
+
+def make_lines(count):
+    return ['data/foo-ground-truth/line_%05d.lstmf\n' % i for i in range(count)]
+
+
+def test_shuffle_lines_like_baseline():
+    lines = make_lines(1000)
+    random.Random(5).shuffle(lines)
+    assert shuffle.shuffle_lines(lines, '42') == baseline_shuffle(lines, '42')
+
+
+def test_script_like_baseline(tmp_path):
+    path = tmp_path / 'all-lstmf'
+    lines = make_lines(500)
+    path.write_text(''.join(lines))
+    subprocess.run([sys.executable, str(SCRIPT), '7', str(path)], check=True)
+    assert path.read_text() == ''.join(baseline_shuffle(lines, '7'))
+
+
+def external(data, seed, memory, tmp_path):
+    out = io.BytesIO()
+    shuffle.external_shuffle(io.BytesIO(data), out, seed, memory, str(tmp_path))
+    return out.getvalue()
+
+
+@pytest.mark.parametrize(
+    'lines',
+    [
+        make_lines(5000),
+        make_lines(1000) + ['same.lstmf\n'] * 20000,
+        ['same.lstmf\n'] * 10000,
+    ],
+    ids=['unique', 'duplicates', 'one line'],
+)
+def test_external_shuffle_independent_of_memory(lines, tmp_path):
+    data = ''.join(lines).encode('utf-8')
+    expected = external(data, '3', 10**9, tmp_path)
+    assert sorted(expected.splitlines()) == sorted(data.splitlines())
+    for memory in (4096, 50000, 10**6):
+        assert external(data, '3', memory, tmp_path) == expected
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_external_shuffle_adds_final_newline(tmp_path):
+    assert sorted(external(b'b\na', '1', 10**6, tmp_path).splitlines(True)) == [
+        b'a\n',
+        b'b\n',
+    ]